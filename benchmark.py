@@ -0,0 +1,314 @@
+"""Throughput benchmarks of parsing, tree aggregation and WizTree writing for every supported input.
+
+Inputs are synthetic and generated from a seed, so two runs with the same arguments measure the same work:
+
+    python benchmark.py --tus 200 --includes 400 --functions 200 --depth 8
+"""
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+
+import main
+import main_ue423
+from link_times import get_wiztree_parent
+from timing_tree import CompactTree, flatten_tree
+from wiztree import WizTreeWriter
+
+LOG_FORMATS = ("Unreal", "MSVC", "Qt")
+
+# Prefix and indentation of the timing lines of an action, see main.LOG_CONFIGURATIONS.
+LOG_LINE_PREFIXES = {"Unreal": "ParallelExecutor.ExecuteActions:   ", "MSVC": "  ", "Qt": ""}
+
+HEADER_NAMES = ["C:\\Engine\\Source\\Runtime\\Module{}\\Public\\Header{}.h".format(index % 7, index) for index in range(300)]
+CLASS_NAMES = ["FClass{}".format(index) for index in range(100)]
+FUNCTION_NAMES = ["FClass{}::Function{}(int,const FString &)".format(index % 100, index) for index in range(400)]
+
+WIZTREE_HEADER = "File Name,Size,Allocated,Modified,Attributes,Files,Folders\n"
+
+
+def make_section_lines(rng, title, names, count, depth):
+    """Returns the lines of one section ( e.g. "Include Headers:" ) holding a random tree of count nodes at most depth deep.
+
+    A node's inclusive time is always split between its children, so self times are never negative.
+    """
+    lines = [title, "\tCount: {}".format(count)]
+    # Time left to hand out to the children of every open node, the first entry being the top level.
+    budgets = [rng.uniform(1.0, 10.0)]
+    top_level = []
+    total = 0.0
+    for _ in range(count):
+        del budgets[rng.randint(1, min(len(budgets), depth)):]
+        duration = budgets[-1] * rng.uniform(0.05, 0.5)
+        budgets[-1] -= duration
+        budgets.append(duration)
+
+        name = rng.choice(names)
+        lines.append("\t" * len(budgets) + "{}: {:f}s".format(name, duration))
+        if len(budgets) == 2:
+            top_level.append((name, duration))
+            total += duration
+
+    top_level = sorted(top_level, key=lambda item: item[1], reverse=True)[:3]
+    lines.append("")
+    lines.append("\tTop {} (top-level only):".format(len(top_level)))
+    lines.extend("\t\t{}: {:f}s".format(name, duration) for name, duration in top_level)
+    lines.append("")
+    lines.append("\tTotal: {:f}s".format(total))
+    return lines
+
+
+def make_action_lines(rng, file_name, include_count, function_count, depth):
+    """Returns the timing output of the compiler for a single translation unit, without any prefix."""
+    lines = []
+    lines += make_section_lines(rng, "Include Headers:", HEADER_NAMES, include_count, depth)
+    lines += make_section_lines(rng, "Class Definitions:", CLASS_NAMES, function_count, depth)
+    lines += make_section_lines(rng, "Function Definitions:", FUNCTION_NAMES, function_count, depth)
+
+    frontend_time = rng.uniform(0.5, 20.0)
+    backend_time = rng.uniform(0.1, 10.0)
+    lines += [
+        "time(C:\\VS\\bin\\c1xx.dll)={:.5f}s < 1 - 2 > BB [C:\\Project\\{}]".format(frontend_time, file_name),
+        "Elapsed Time before Code Generation: {:.3f} sec".format(frontend_time),
+        "Code Generation Summary",
+        "\tTotal Function Count: {}".format(function_count),
+        "\tElapsed Time: {:.3f} sec".format(backend_time),
+        "\tTotal Compilation Time: {:.3f} sec".format(backend_time),
+        "\tAverage time per function: {:.3f} sec".format(backend_time / max(1, function_count)),
+        "\tAnomalistic Compile Times: 1",
+        "\t\t?Function@@YAXXZ: {:.3f} sec, 512 instrs".format(backend_time / 2),
+        "\tSerialized Initializer Count: 1",
+        "\tSerialized Initializer Time: 0.001 sec",
+        "",
+        "RdrReadProc Caching Stats",
+        "\tFunctions Cached: 5",
+        "\tRetrieved Count: 3",
+        "\tAbandoned Retrieval Count: 0",
+        "\tAbandoned Caching Count: 0",
+        "\tWasted Caching Attempts: 0",
+        "\tFunctions Retrieved at Least Once: 2",
+        "\tFunctions Cached and Never Retrieved: 3",
+        "\tMost Hits:",
+        "\t\t?Function@@YAXXZ: 3",
+        "",
+        "\tLeast Hits:",
+        "\t\t?Other@@YAXXZ: 1",
+        "",
+        "Elapsed Time after Code Generation: {:.3f} sec".format(frontend_time + backend_time),
+        "time(C:\\VS\\bin\\c2.dll)={:.5f}s < 1 - 2 > BB [C:\\Project\\{}]".format(backend_time, file_name),
+    ]
+    return lines
+
+
+def make_link_lines(binary):
+    """Returns the /time+ output of the linker for a binary, without any prefix. Like the linker, times are rounded
+    to the millisecond, so that the passes add up to slightly more than the Final total."""
+    lines = ["Linker: Pass {}: Interval #1, time = 0.334s [{}]".format(index, binary) for index in (1, 2, 3)]
+    lines.append("Linker: Final Total time = 1.000s < 1 - 2 > PB: 5791744 [{}]".format(binary))
+    return lines
+
+
+def write_log(path, log_format, tu_count, include_count, function_count, depth, seed=0):
+    """Writes a synthetic Unreal, MSVC or Qt log compiling tu_count files. Unreal logs also link a binary
+    halfway through and at the end."""
+    rng = random.Random(seed)
+    prefix = LOG_LINE_PREFIXES[log_format]
+    binary = "C:\\Project\\Binaries\\UE4Editor-Module.dll"
+    with open(path, "w", encoding="utf-8") as file:
+        if log_format == "Unreal":
+            file.write("Log file open, Unreal Build Tool\n")
+            file.write("ParallelExecutor.ExecuteActions: Building {} actions\n".format(tu_count + 2))
+        elif log_format == "Qt":
+            file.write("\tQt build\n")
+
+        for index in range(tu_count):
+            file_name = "Module.File{}.cpp".format(index)
+            if log_format == "Unreal":
+                file.write("ParallelExecutor.ExecuteActions:   [{}/{}] {}\n".format(index + 1, tu_count, file_name))
+            else:
+                file.write("{}{}\n".format(prefix, file_name))
+
+            lines = make_action_lines(rng, file_name, include_count, function_count, depth)
+            file.write("".join(prefix + line + "\n" for line in lines))
+
+            if log_format == "Unreal" and index + 1 in (tu_count // 2, tu_count):
+                file.write("ParallelExecutor.ExecuteActions:   [{}/{}] Link UE4Editor-Module.dll\n".format(index + 1, tu_count + 2))
+                file.write("".join(prefix + line + "\n" for line in make_link_lines(binary)))
+
+
+def write_timing_files(path, tu_count, include_count, function_count, depth, seed=0):
+    """Writes tu_count synthetic .cpp.timing.txt files under an Intermediate like folder and returns their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for index in range(tu_count):
+        folder = os.path.join(path, "Intermediate", "Build", "Win64", "UE4Editor", "Development", "Module{}".format(index % 8))
+        os.makedirs(folder, exist_ok=True)
+        file_name = "Module{}.File{}.cpp".format(index % 8, index)
+        paths.append(os.path.join(folder, file_name + ".timing.txt"))
+        with open(paths[-1], "w", encoding="utf-8") as file:
+            file.write("".join(line + "\n" for line in make_action_lines(rng, file_name, include_count, function_count, depth)))
+    return paths
+
+
+def count_nodes(tree):
+    if isinstance(tree, CompactTree):
+        return len(tree)
+    elif hasattr(tree, "get_nodes_po"):
+        return sum(1 for _ in tree.get_nodes_po())
+    else:
+        return len(flatten_tree(tree)[0])
+
+
+class Result:
+    """Throughput of a single benchmark, keeping the fastest of every repeat."""
+
+    def __init__(self, name, size, nodes):
+        self.name = name
+        self.size = size
+        self.nodes = nodes
+        self.seconds = float("inf")
+
+    def add_run(self, seconds):
+        self.seconds = min(self.seconds, seconds)
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-9)
+        return "{:<24}{:>10.3f}s{:>12.2f} MB/s{:>14.0f} nodes/s".format(
+            self.name, self.seconds, self.size / seconds / 1024 / 1024, self.nodes / seconds)
+
+
+def time_call(function, *args):
+    """Returns ( seconds, result ) of a call, with the garbage collector flushed beforehand."""
+    gc.collect()
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def get_size(paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def parse_log(path, compact):
+    """Returns the LogRecord of every file of a log and the trees of the binaries it links."""
+    with open(path, encoding="utf-8-sig") as file:
+        reader = main.LineReader(file)
+        parser = main.LogParser(reader, main.detect_configuration(reader.peek()), verbose=False, compact=compact)
+        records = list(parser.iter_records())
+    return records, parser.links
+
+
+def write_log_wiztree_files(records, links, output_path):
+    names = ("includes", "classes", "functions")
+    paths = {name: os.path.join(output_path, "log_{}.csv".format(name)) for name in names + (("links",) if links else ())}
+    with WizTreeWriter(paths, WIZTREE_HEADER) as writer:
+        for record in records:
+            for name, tree in zip(names, (record.headers, record.classes, record.functions)):
+                writer.write_rows(name, tree.get_wiztree_rows())
+        for binary, tree in links.items():
+            tree.compute_num_children()
+            writer.write_rows("links", tree.get_wiztree_rows(get_wiztree_parent(binary)))
+    return list(writer.paths.values())
+
+
+def write_timing_wiztree_files(timing_files, output_path):
+    names = ("includes", "classes", "functions")
+    paths = {name: os.path.join(output_path, "timing_{}.csv".format(name)) for name in names}
+    with WizTreeWriter(paths, WIZTREE_HEADER, encoding="utf-8") as writer:
+        for timing_file in timing_files:
+            for name, tree in zip(names, (timing_file.headers, timing_file.classes, timing_file.functions)):
+                writer.write_rows(name, main_ue423.get_wiztree_rows(tree))
+    return list(writer.paths.values())
+
+
+def benchmark_log(path, output_path, log_format, repeat, compact):
+    """Benchmarks main.py on a log. Returns a Result for parsing, aggregation and WizTree writing."""
+    size = os.path.getsize(path)
+    parse = aggregate = write = None
+    for _ in range(repeat):
+        seconds, (records, links) = time_call(parse_log, path, compact)
+        trees = [tree for record in records for tree in (record.headers, record.classes, record.functions)]
+        if parse is None:
+            nodes = sum(map(count_nodes, trees))
+            parse = Result("{} parse".format(log_format), size, nodes)
+            aggregate = Result("{} aggregate".format(log_format), size, nodes)
+            write = Result("{} wiztree".format(log_format), 0, nodes)
+        parse.add_run(seconds)
+
+        # Compact trees are aggregated while parsing, so that step is timed again on its own.
+        seconds, _ = time_call(lambda: [tree.cache_useful_data() if compact else tree.compute_num_children() for tree in trees])
+        aggregate.add_run(seconds)
+
+        seconds, paths = time_call(write_log_wiztree_files, records, links, output_path)
+        write.size = get_size(paths)
+        write.add_run(seconds)
+
+    return [parse, aggregate, write]
+
+
+def benchmark_timing_files(paths, output_path, repeat, compact):
+    """Benchmarks main_ue423.py on .cpp.timing.txt files. Returns a Result for parsing, aggregation and WizTree writing."""
+    size = get_size(paths)
+    parse = aggregate = write = None
+    for _ in range(repeat):
+        seconds, timing_files = time_call(lambda: list(main_ue423.iter_timing_files(paths, compact)))
+        trees = [tree for timing_file in timing_files for tree in (timing_file.headers, timing_file.classes, timing_file.functions)]
+        if parse is None:
+            nodes = sum(map(count_nodes, trees))
+            parse = Result("timing.txt parse", size, nodes)
+            aggregate = Result("timing.txt aggregate", size, nodes)
+            write = Result("timing.txt wiztree", 0, nodes)
+        parse.add_run(seconds)
+
+        seconds, _ = time_call(lambda: [tree.cache_useful_data() for tree in trees])
+        aggregate.add_run(seconds)
+
+        seconds, wiztree_paths = time_call(write_timing_wiztree_files, timing_files, output_path)
+        write.size = get_size(wiztree_paths)
+        write.add_run(seconds)
+
+    return [parse, aggregate, write]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measures parsing, aggregation and WizTree writing throughput on synthetic build logs.")
+    parser.add_argument("--tus", type=int, default=100, help="Number of translation units of every input.")
+    parser.add_argument("--includes", type=int, default=400, help="Number of include lines per translation unit.")
+    parser.add_argument("--functions", type=int, default=200, help="Number of class and of function lines per translation unit.")
+    parser.add_argument("--depth", type=int, default=8, help="Maximum include and function nesting depth.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated inputs.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every benchmark, the fastest one is reported.")
+    parser.add_argument("--compact", action="store_true", help="Benchmark the array-backed trees.")
+    parser.add_argument("--formats", nargs="+", default=LOG_FORMATS + ("timing",), choices=LOG_FORMATS + ("timing",),
+                        help="Inputs to benchmark.")
+    parser.add_argument("--keep", metavar="PATH", help="Generate the inputs and outputs in PATH and keep them, instead of a temporary folder.")
+    return parser.parse_args()
+
+
+def main_benchmark():
+    arguments = parse_arguments()
+
+    with tempfile.TemporaryDirectory() as temporary_path:
+        path = arguments.keep or temporary_path
+        os.makedirs(path, exist_ok=True)
+
+        print("{} translation units, {} includes and {} functions each, depth {}{}".format(
+            arguments.tus, arguments.includes, arguments.functions, arguments.depth, ", compact trees" if arguments.compact else ""))
+        results = []
+        for log_format in arguments.formats:
+            if log_format == "timing":
+                paths = write_timing_files(path, arguments.tus, arguments.includes, arguments.functions, arguments.depth, arguments.seed)
+                results += benchmark_timing_files(paths, path, arguments.repeat, arguments.compact)
+            else:
+                log_path = os.path.join(path, "{}.txt".format(log_format))
+                write_log(log_path, log_format, arguments.tus, arguments.includes, arguments.functions, arguments.depth, arguments.seed)
+                results += benchmark_log(log_path, path, log_format, arguments.repeat, arguments.compact)
+
+            for result in results[-3:]:
+                print(result)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,236 @@
+"""Compares two builds and reports the headers, classes and functions that got slower or faster.
+
+Builds are given as logs, folders of .cpp.timing.txt files or results databases written with --db:
+
+    python build_diff.py Before/Log.txt After/Log.txt --count 30
+"""
+import argparse
+import heapq
+import math
+import os
+from array import array
+
+import compile_times
+from compression import strip_compression
+from results_db import get_tree_columns, is_results_database, iter_database_trees
+from symbols import SYMBOLS
+from timing_tree import aggregate_tree
+
+CATEGORIES = ("includes", "classes", "functions")
+
+
+def get_translation_unit_name(path):
+    """Name a translation unit is matched by, the same for a log action and its .cpp.timing.txt file."""
+    name = os.path.basename(strip_compression(path))
+    return name[:-len(".timing.txt")] if name.endswith(".timing.txt") else name
+
+
+class CategoryTimings:
+    """Inclusive and self time of every node of one category of a build.
+
+    Nodes are keyed by the hash of their parent's key and their name, which identifies the translation unit,
+    the path in the tree and the name at once. Nodes sharing a key ( e.g. a header included twice by the same
+    file ) are summed. Every key gets a slot in flat arrays, names are stored as SYMBOLS ids.
+    """
+
+    def __init__(self):
+        self.slots = {}
+
+        self.name_id = array("i")
+        self.parent = array("i")
+        self.inclusive_time = array("d")
+        self.self_time = array("d")
+
+    def __len__(self):
+        return len(self.name_id)
+
+    def add_tree(self, translation_unit, names, parents, durations):
+        """Adds a tree in the format of get_tree_columns. Its root is renamed after the translation unit."""
+        self_times = aggregate_tree(parents, durations).self_duration
+        slots = self.slots
+        keys = []
+        node_slots = []
+        for index, parent in enumerate(parents):
+            if parent < 0:
+                name = translation_unit
+                key = hash(name)
+            else:
+                name = names[index]
+                key = hash((keys[parent], name))
+            keys.append(key)
+
+            slot = slots.get(key)
+            if slot is None:
+                slot = slots[key] = len(self.name_id)
+                self.name_id.append(SYMBOLS.intern(name))
+                self.parent.append(node_slots[parent] if parent >= 0 else -1)
+                self.inclusive_time.append(durations[index])
+                self.self_time.append(self_times[index])
+            else:
+                self.inclusive_time[slot] += durations[index]
+                self.self_time[slot] += self_times[index]
+            node_slots.append(slot)
+
+    def get_path(self, slot):
+        """Returns the translation unit and the names down to the node of slot, separated by \\."""
+        names = []
+        while slot >= 0:
+            names.append(SYMBOLS.names[self.name_id[slot]])
+            slot = self.parent[slot]
+        return "\\".join(reversed(names))
+
+
+class BuildTimings:
+    """CategoryTimings of every category of a build."""
+
+    def __init__(self):
+        self.categories = {category: CategoryTimings() for category in CATEGORIES}
+
+    def add_record(self, record):
+        """Adds the trees of a LogRecord or a TimingFile."""
+        translation_unit = get_translation_unit_name(record.path)
+        for category, tree in zip(CATEGORIES, (record.headers, record.classes, record.functions)):
+            if tree is not None:
+                names, paths, parents, depths, durations = get_tree_columns(tree)
+                self.categories[category].add_tree(translation_unit, names, parents, durations)
+
+
+def load_build(path):
+    """Returns the BuildTimings of a log, a folder of .cpp.timing.txt files or a results database."""
+    build = BuildTimings()
+    if is_results_database(path):
+        for translation_unit, category, names, parents, durations in iter_database_trees(path):
+            build.categories[category].add_tree(get_translation_unit_name(translation_unit), names, parents, durations)
+    else:
+        for record in compile_times.iter_records(path, compact=True):
+            build.add_record(record)
+    return build
+
+
+class DiffEntry:
+    """Time of a single node in both builds, 0 in the build it is missing from."""
+
+    __slots__ = ("path", "old_time", "new_time")
+
+    def __init__(self, path, old_time, new_time):
+        self.path = path
+        self.old_time = old_time
+        self.new_time = new_time
+
+    @property
+    def delta(self):
+        return self.new_time - self.old_time
+
+    @property
+    def ratio(self):
+        """New time relative to the old one, inf for a node that was added."""
+        return self.new_time / self.old_time if self.old_time > 0 else math.inf
+
+
+class CategoryDiff:
+    """Largest changes of a category between two builds, found in linear time.
+
+    Relative changes only consider nodes present in both builds and taking at least min_time in one of them,
+    so that tiny nodes don't drown everything else.
+    """
+
+    def __init__(self, old, new, count=20, min_time=0.01, self_time=False):
+        old_times = old.self_time if self_time else old.inclusive_time
+        new_times = new.self_time if self_time else new.inclusive_time
+
+        # Slot of every new node in the old build, -1 for added nodes.
+        old_slots = array("i", [-1]) * len(new)
+        for key, slot in new.slots.items():
+            old_slot = old.slots.get(key)
+            if old_slot is not None:
+                old_slots[slot] = old_slot
+        removed = [slot for key, slot in old.slots.items() if key not in new.slots]
+
+        self.matched_count = len(new) - old_slots.count(-1)
+        self.added_count = len(new) - self.matched_count
+        self.removed_count = len(removed)
+        # Roots are the translation units.
+        self.old_total = sum(old.inclusive_time[slot] for slot in range(len(old)) if old.parent[slot] < 0)
+        self.new_total = sum(new.inclusive_time[slot] for slot in range(len(new)) if new.parent[slot] < 0)
+
+        def get_delta(slot):
+            old_slot = old_slots[slot]
+            return new_times[slot] - (old_times[old_slot] if old_slot >= 0 else 0.0)
+
+        def make_entry(slot):
+            old_slot = old_slots[slot]
+            return DiffEntry(new.get_path(slot), old_times[old_slot] if old_slot >= 0 else 0.0, new_times[slot])
+
+        def make_removed_entry(slot):
+            return DiffEntry(old.get_path(slot), old_times[slot], 0.0)
+
+        slots = range(len(new))
+        self.regressions = [make_entry(slot) for slot in heapq.nlargest(count, slots, get_delta) if get_delta(slot) > 0]
+
+        # Removed nodes are improvements too, merged with the matched ones by delta.
+        improvements = [(get_delta(slot), make_entry, slot) for slot in heapq.nsmallest(count, slots, get_delta)]
+        improvements += [(-old_times[slot], make_removed_entry, slot)
+                         for slot in heapq.nlargest(count, removed, old_times.__getitem__)]
+        self.improvements = [make(slot) for delta, make, slot in sorted(improvements, key=lambda item: item[0])[:count] if delta < 0]
+
+        compared = [slot for slot in slots if old_slots[slot] >= 0 and max(new_times[slot], old_times[old_slots[slot]]) >= min_time]
+
+        def get_ratio(slot):
+            old_time = old_times[old_slots[slot]]
+            return new_times[slot] / old_time if old_time > 0 else math.inf
+
+        self.relative_regressions = [make_entry(slot) for slot in heapq.nlargest(count, compared, get_ratio) if get_ratio(slot) > 1]
+        self.relative_improvements = [make_entry(slot) for slot in heapq.nsmallest(count, compared, get_ratio) if get_ratio(slot) < 1]
+
+
+def diff_builds(old, new, count=20, min_time=0.01, self_time=False):
+    """Returns a CategoryDiff of every category of two BuildTimings."""
+    return {category: CategoryDiff(old.categories[category], new.categories[category], count, min_time, self_time)
+            for category in CATEGORIES}
+
+
+def print_entries(title, entries):
+    print("  {}:".format(title))
+    if not entries:
+        print("    none")
+    for entry in entries:
+        ratio = "new" if entry.old_time == 0 else "x{:.2f}".format(entry.ratio)
+        print("    {:+10.3f}s {:>8}  {:.3f}s -> {:.3f}s  {}".format(entry.delta, ratio, entry.old_time, entry.new_time, entry.path))
+
+
+def print_diff(diffs):
+    for category, diff in diffs.items():
+        print("{}: {} matched, {} added, {} removed, total {:.3f}s -> {:.3f}s ({:+.3f}s)".format(
+            category.capitalize(), diff.matched_count, diff.added_count, diff.removed_count,
+            diff.old_total, diff.new_total, diff.new_total - diff.old_total))
+        print_entries("Largest regressions", diff.regressions)
+        print_entries("Largest improvements", diff.improvements)
+        print_entries("Largest relative regressions", diff.relative_regressions)
+        print_entries("Largest relative improvements", diff.relative_improvements)
+        print()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Reports the headers, classes and functions that got slower or faster between two builds.")
+    parser.add_argument("old", help="log, folder of .cpp.timing.txt files or results database of the reference build")
+    parser.add_argument("new", help="log, folder of .cpp.timing.txt files or results database of the build to compare")
+    parser.add_argument("-n", "--count", type=int, default=20, help="entries listed per category and ranking (default: 20)")
+    parser.add_argument("--min-time", type=float, default=0.01, metavar="SECONDS",
+                        help="nodes faster than this in both builds are left out of the relative rankings (default: 0.01)")
+    parser.add_argument("--self", action="store_true", dest="self_time",
+                        help="compare self times instead of inclusive times")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    print("Loading {}".format(arguments.old))
+    old = load_build(arguments.old)
+    print("Loading {}".format(arguments.new))
+    new = load_build(arguments.new)
+    print()
+    print_diff(diff_builds(old, new, arguments.count, arguments.min_time, arguments.self_time))
+
+
+if __name__ == "__main__":
+    main()
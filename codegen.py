@@ -0,0 +1,165 @@
+"""Splits the cost of every translation unit between the compiler frontend and code generation.
+
+MSVC prints the time spent in c1xx.dll ( frontend ) and c2.dll ( backend ) for every file, and with
+/d2cgsummary a code generation summary listing the functions that took anomalously long to compile:
+
+    python codegen.py Log.txt --sort share -n 30
+"""
+import argparse
+import csv
+
+from hotspots import TopK
+
+CODEGEN_CSV_COLUMNS = ("file", "frontend_time", "backend_time", "backend_share", "function_count", "codegen_time",
+                       "anomalous_function_count", "anomalous_function_time", "serialized_initializer_time", "functions_cached")
+
+
+class AnomalousFunction:
+    """A function listed under "Anomalistic Compile Times" by the code generation summary."""
+
+    __slots__ = ("name", "time", "instruction_count")
+
+    def __init__(self, name, time, instruction_count):
+        self.name = name
+        self.time = time
+        self.instruction_count = instruction_count
+
+
+class CodeGenStats:
+    """Timings a compiler prints around code generation for a single file. Values missing from the log are 0.
+
+    frontend_time and backend_time come from the time( lines of c1xx.dll and c2.dll. The Code Generation Summary
+    and RdrReadProc Caching Stats sections are only printed with /d2cgsummary, most_hits and least_hits are
+    ( function, hit count ) pairs.
+    """
+
+    __slots__ = ("frontend_time", "backend_time", "elapsed_before_codegen", "elapsed_after_codegen",
+                 "function_count", "codegen_time", "total_compilation_time", "average_function_time",
+                 "anomalous_functions", "serialized_initializer_count", "serialized_initializer_time",
+                 "functions_cached", "retrieved_count", "abandoned_retrieval_count", "abandoned_caching_count",
+                 "wasted_caching_attempts", "functions_retrieved", "functions_never_retrieved", "most_hits", "least_hits")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+        self.anomalous_functions = []
+        self.most_hits = []
+        self.least_hits = []
+
+    @property
+    def total_time(self):
+        return self.frontend_time + self.backend_time
+
+    @property
+    def backend_share(self):
+        """Part of the compile time spent generating code, between 0 and 1."""
+        total = self.total_time
+        return self.backend_time / total if total > 0 else 0.0
+
+
+def parse_time_line(line):
+    """Returns the seconds of a "time(C:\\...\\c1xx.dll)=1.234s < ... > ..." line, 0 if they can't be read."""
+    try:
+        return float(line.split(")=", 1)[1].split("s", 1)[0])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+def parse_anomalous_function(line):
+    """Parses a "?Name@@YAXXZ: 0.040 sec, 512 instrs" line of the code generation summary.
+    Returns None if the line doesn't hold a time, a missing or unreadable instruction count is 0."""
+    name, separator, values = line.strip().rpartition(": ")
+    time, _, instructions = values.partition(",")
+    time = time.split()
+    instructions = instructions.split()
+    try:
+        time = float(time[0])
+    except (IndexError, ValueError):
+        return None
+    try:
+        instructions = int(instructions[0]) if instructions else 0
+    except ValueError:
+        instructions = 0
+    return AnomalousFunction(name, time, instructions) if separator else None
+
+
+def parse_hits_line(line):
+    """Parses a "?Name: 3" line of the Most Hits and Least Hits lists. Returns None if the line doesn't hold a hit count."""
+    name, separator, hits = line.strip().rpartition(": ")
+    try:
+        return (name, int(hits)) if separator else None
+    except ValueError:
+        return None
+
+
+def get_anomalous_time(stats):
+    return sum(function.time for function in stats.anomalous_functions)
+
+
+def print_codegen_report(stats, count=20, sort="backend"):
+    """Prints the count files spending the most time in code generation, by backend time or by backend share,
+    and the slowest functions to compile. stats maps files to CodeGenStats."""
+    frontend_time = sum(file_stats.frontend_time for file_stats in stats.values())
+    backend_time = sum(file_stats.backend_time for file_stats in stats.values())
+    total_time = frontend_time + backend_time
+    print("{} files, frontend {:.3f}s, backend {:.3f}s ({:.1%})".format(
+        len(stats), frontend_time, backend_time, backend_time / total_time if total_time > 0 else 0.0))
+
+    key = (lambda item: item[1].backend_share) if sort == "share" else (lambda item: item[1].backend_time)
+    print("Files by {}:".format("backend share" if sort == "share" else "backend time"))
+    for file, file_stats in sorted(stats.items(), key=key, reverse=True)[:count]:
+        print("  frontend {:8.3f}s  backend {:8.3f}s ({:5.1%})  {} functions, {} anomalous  {}".format(
+            file_stats.frontend_time, file_stats.backend_time, file_stats.backend_share,
+            file_stats.function_count, len(file_stats.anomalous_functions), file))
+
+    top = TopK(count)
+    for file, file_stats in stats.items():
+        for function in file_stats.anomalous_functions:
+            if function.time > top.threshold:
+                top.push(function.time, (file, function))
+    items = top.get_items()
+    if items:
+        print("Slowest functions to compile:")
+        for time, (file, function) in items:
+            print("  {:8.3f}s  {} instructions  {}: {}".format(time, function.instruction_count, file, function.name))
+
+
+def write_codegen_csv(path, stats):
+    """Writes a row per file of stats ( file -> CodeGenStats ) to a .csv file."""
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(CODEGEN_CSV_COLUMNS)
+        for name, file_stats in stats.items():
+            writer.writerow((name, file_stats.frontend_time, file_stats.backend_time, round(file_stats.backend_share, 6),
+                             file_stats.function_count, file_stats.codegen_time, len(file_stats.anomalous_functions),
+                             get_anomalous_time(file_stats), file_stats.serialized_initializer_time, file_stats.functions_cached))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Splits the compile time of every file between frontend and code generation.")
+    parser.add_argument("path", help="Unreal, MSVC or Qt log, - reads it from stdin")
+    parser.add_argument("-n", "--count", type=int, default=20, help="files and functions listed (default: 20)")
+    parser.add_argument("--sort", choices=("backend", "share"), default="backend",
+                        help="rank files by backend time or by the share of their time spent in the backend (default: backend)")
+    parser.add_argument("--csv", metavar="PATH", help="also write the stats of every file to a .csv file")
+    return parser.parse_args()
+
+
+def main():
+    # main.py uses this module to store the stats it parses, so the parsers are only imported when running standalone.
+    import compile_times
+
+    arguments = parse_arguments()
+    stats = {}
+    for record in compile_times.iter_records(arguments.path, compact=True):
+        record_stats = getattr(record, "codegen", None)
+        if record_stats is not None:
+            stats[record.path] = record_stats
+
+    print_codegen_report(stats, arguments.count, arguments.sort)
+    if arguments.csv:
+        write_codegen_csv(arguments.csv, stats)
+
+
+if __name__ == "__main__":
+    main()
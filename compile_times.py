@@ -0,0 +1,34 @@
+"""Importable API yielding parsed timing records one translation unit at a time.
+
+    import compile_times
+
+    for record in compile_times.iter_records("Log.txt"):
+        print(record.path, record.functions.time if record.functions else 0)
+"""
+import os
+
+from compression import is_tar_archive, strip_compression
+from main import LogRecord, iter_log_records
+from main_ue423 import TimingFile, get_timing_file_paths, iter_archive_timing_files, iter_timing_files
+from shards import ShardRecord, is_shard, iter_shard_records
+
+
+def iter_records(path, compact=False, min_time=0.0):
+    """Yields a record for every translation unit of path, parsed lazily.
+
+    path is an Unreal/MSVC/Qt log ("-" for stdin), a .cpp.timing.txt file, a folder searched for them, a tar archive of one
+    or a shard written by shards.py, whose trees are yielded as they were stored whatever compact and min_time.
+    Logs and timing files can be compressed with gzip, bzip2 or xz.
+    Records are LogRecord, TimingFile or ShardRecord instances, all have path, name, headers, classes and functions.
+    Nodes shorter than min_time seconds are collapsed into an "other (N items)" node per parent.
+    """
+    if path != "-" and os.path.isdir(path):
+        return iter_timing_files(get_timing_file_paths(path), compact, min_time)
+    elif is_shard(path):
+        return iter_shard_records(path)
+    elif is_tar_archive(path):
+        return iter_archive_timing_files(path, compact, min_time)
+    elif strip_compression(path).endswith(".timing.txt"):
+        return iter_timing_files([path], compact, min_time)
+    else:
+        return iter_log_records(path, compact, min_time)
@@ -0,0 +1,65 @@
+import bz2
+import gzip
+import lzma
+import tarfile
+
+# Extension of a compressed file -> function opening it like open().
+DECOMPRESSORS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# Raised when reading a corrupt or truncated compressed file.
+DECOMPRESSION_ERRORS = (OSError, EOFError, lzma.LZMAError, tarfile.TarError)
+
+
+def get_compression(path):
+    """Returns the compression extension of path ( .gz, .bz2 or .xz ), or None for an uncompressed file."""
+    path = str(path).lower()
+    for extension in DECOMPRESSORS:
+        if path.endswith(extension):
+            return extension
+    return None
+
+
+def strip_compression(path):
+    """Returns path without its compression extension, e.g. Log.txt for Log.txt.gz."""
+    extension = get_compression(path)
+    return str(path)[:-len(extension)] if extension else path
+
+
+def open_text(path, encoding="utf-8-sig"):
+    """Opens path for reading text, decompressing it on the fly if its extension is .gz, .bz2 or .xz.
+    Nothing is decompressed to disk or held in memory beyond the current block."""
+    extension = get_compression(path)
+    if extension:
+        return DECOMPRESSORS[extension](path, "rt", encoding=encoding)
+    return open(path, "r", encoding=encoding)
+
+
+def decompress_stream(file, name):
+    """Wraps a binary file object so that it reads decompressed data if name is that of a compressed file."""
+    extension = get_compression(name)
+    if extension == ".gz":
+        return gzip.GzipFile(fileobj=file)
+    elif extension == ".bz2":
+        return bz2.BZ2File(file)
+    elif extension == ".xz":
+        return lzma.LZMAFile(file)
+    return file
+
+
+def is_tar_archive(path):
+    return str(path).lower().endswith(TAR_EXTENSIONS)
+
+
+def iter_tar_members(path, name_filter, encoding="utf-8"):
+    """Yields ( member name, text ) for every file of a tar archive whose name passes name_filter.
+
+    The archive is read in a single forward pass, whatever its compression, and members may be compressed
+    themselves. Only the current member is held in memory.
+    """
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and name_filter(member.name):
+                with decompress_stream(archive.extractfile(member), member.name) as data:
+                    yield member.name, data.read().decode(encoding)
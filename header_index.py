@@ -0,0 +1,127 @@
+from array import array
+
+from symbols import SYMBOLS
+from timing_tree import CompactTree, aggregate_tree, flatten_tree, is_other_name
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class HeaderCost:
+    """Cost of a single header over every translation unit."""
+
+    __slots__ = ("path", "include_count", "inclusive_time", "exclusive_time", "tu_count")
+
+    def __init__(self, path, include_count, inclusive_time, exclusive_time, tu_count):
+        self.path = path
+        self.include_count = include_count
+        self.inclusive_time = inclusive_time
+        self.exclusive_time = exclusive_time
+        self.tu_count = tu_count
+
+    @property
+    def pch_savings(self):
+        """Estimated seconds saved by moving the header to a precompiled header.
+
+        Every translation unit pays the average inclusion cost today, with a PCH it is paid once.
+        """
+        return self.inclusive_time - self.inclusive_time / self.tu_count
+
+
+class HeaderIndex:
+    """Include occurrences of every translation unit, aggregated per full header path.
+
+    Occurrences are appended to flat arrays as trees are added and aggregated in one batch,
+    with NumPy if it is installed.
+    """
+
+    def __init__(self):
+        self.paths = []
+        # Symbol id of a path -> index in paths.
+        self.path_ids = {}
+        self.tu_count = 0
+
+        # One entry per include occurrence.
+        self.header_ids = array("i")
+        self.tu_ids = array("i")
+        self.inclusive_times = array("d")
+        self.exclusive_times = array("d")
+
+    def add_tree(self, tree):
+        """Adds the includes of a translation unit. tree is a Tree, a CompactLogTree or a CompactTree whose root is the TU."""
+        if isinstance(tree, CompactTree) and tree.symbols is SYMBOLS:
+            # Trees using the shared symbol table already store ids, no string has to be looked up.
+            symbol_ids = [path_id if path_id >= 0 else name_id for name_id, path_id in zip(tree.name_id[1:], tree.path_id[1:])]
+            inclusive_times = tree.duration[1:]
+            exclusive_times = aggregate_tree(tree.parent, tree.duration).self_duration[1:]
+        elif isinstance(tree, CompactTree):
+            symbol_ids = [SYMBOLS.intern(tree.get_path(index)) for index in range(1, len(tree))]
+            inclusive_times = tree.duration[1:]
+            exclusive_times = aggregate_tree(tree.parent, tree.duration).self_duration[1:]
+        else:
+            nodes, parents = flatten_tree(tree)
+            durations = [node.time for node in nodes]
+            symbol_ids = [SYMBOLS.intern(node.path or node.name) for node in nodes[1:]]
+            inclusive_times = durations[1:]
+            exclusive_times = aggregate_tree(parents, durations).self_duration[1:]
+
+        path_ids = self.path_ids
+        # Indexes of the nodes collapsing includes shorter than a minimum time, which are not headers.
+        others = []
+        for index, symbol_id in enumerate(symbol_ids):
+            path_id = path_ids.get(symbol_id)
+            if path_id is None:
+                name = SYMBOLS.names[symbol_id]
+                path_id = path_ids[symbol_id] = -1 if is_other_name(name) else len(self.paths)
+                if path_id >= 0:
+                    self.paths.append(name)
+            if path_id >= 0:
+                self.header_ids.append(path_id)
+            else:
+                others.append(index)
+
+        if others:
+            others = set(others)
+            inclusive_times = [time for index, time in enumerate(inclusive_times) if index not in others]
+            exclusive_times = [time for index, time in enumerate(exclusive_times) if index not in others]
+
+        self.tu_ids.extend([self.tu_count] * len(inclusive_times))
+        self.inclusive_times.extend(inclusive_times)
+        self.exclusive_times.extend(exclusive_times)
+        self.tu_count += 1
+
+    def get_header_costs(self):
+        """Returns a HeaderCost for every header, in the order headers were first seen."""
+        header_count = len(self.paths)
+        if numpy is not None:
+            header_ids = numpy.frombuffer(self.header_ids, dtype=numpy.int32)
+            tu_ids = numpy.frombuffer(self.tu_ids, dtype=numpy.int32)
+            include_counts = numpy.bincount(header_ids, minlength=header_count).tolist()
+            inclusive_times = numpy.bincount(header_ids, numpy.frombuffer(self.inclusive_times), header_count).tolist()
+            exclusive_times = numpy.bincount(header_ids, numpy.frombuffer(self.exclusive_times), header_count).tolist()
+            pairs = numpy.unique(header_ids.astype(numpy.int64) * max(1, self.tu_count) + tu_ids)
+            tu_counts = numpy.bincount(pairs // max(1, self.tu_count), minlength=header_count).tolist()
+        else:
+            include_counts = [0] * header_count
+            inclusive_times = [0.0] * header_count
+            exclusive_times = [0.0] * header_count
+            tu_counts = [0] * header_count
+            last_tus = [-1] * header_count
+            for header_id, tu_id, inclusive_time, exclusive_time in zip(self.header_ids, self.tu_ids, self.inclusive_times, self.exclusive_times):
+                include_counts[header_id] += 1
+                inclusive_times[header_id] += inclusive_time
+                exclusive_times[header_id] += exclusive_time
+                # Occurrences of a TU are contiguous, so a header is new to a TU whenever the TU changed.
+                if last_tus[header_id] != tu_id:
+                    last_tus[header_id] = tu_id
+                    tu_counts[header_id] += 1
+
+        return [HeaderCost(*costs) for costs in zip(self.paths, include_counts, inclusive_times, exclusive_times, tu_counts)]
+
+    def get_pch_candidates(self, count=50, min_tu_count=2):
+        """Returns the count headers whose move to a precompiled header should save the most time."""
+        candidates = [cost for cost in self.get_header_costs() if cost.tu_count >= min_tu_count]
+        candidates.sort(key=lambda cost: cost.pch_savings, reverse=True)
+        return candidates[:count]
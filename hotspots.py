@@ -0,0 +1,164 @@
+"""Lists the slowest headers, classes and functions of a build while it is being parsed.
+
+Only the current translation unit and the K slowest nodes of every category are ever held in memory:
+
+    python hotspots.py Log.txt --functions 50 --per-tu 5
+"""
+import argparse
+import heapq
+import math
+
+from results_db import get_tree_columns
+from timing_tree import aggregate_tree
+
+CATEGORIES = ("includes", "classes", "functions")
+
+
+class TopK:
+    """The count largest items pushed so far, kept in a min heap of at most count entries."""
+
+    def __init__(self, count):
+        self.count = count
+        self.heap = []
+        # Breaks ties between equal values, so that items themselves are never compared.
+        self.pushed = 0
+
+    @property
+    def threshold(self):
+        """Value an item has to exceed to be kept."""
+        if self.count <= 0:
+            return math.inf
+        return self.heap[0][0] if len(self.heap) >= self.count else -math.inf
+
+    def push(self, value, item):
+        self.pushed += 1
+        if len(self.heap) < self.count:
+            heapq.heappush(self.heap, (value, self.pushed, item))
+        elif self.count > 0 and value > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (value, self.pushed, item))
+
+    def get_items(self):
+        """Returns pairs ( value, item ), largest first."""
+        return [(value, item) for value, _, item in sorted(self.heap, reverse=True)]
+
+
+class Hotspot:
+    """A single node of a translation unit."""
+
+    __slots__ = ("translation_unit", "path", "inclusive_time", "self_time")
+
+    def __init__(self, translation_unit, path, inclusive_time, self_time):
+        self.translation_unit = translation_unit
+        self.path = path
+        self.inclusive_time = inclusive_time
+        self.self_time = self_time
+
+
+def get_tree_path(names, parents, index):
+    """Returns the names from the top level node down to the node at index, separated by \\."""
+    path = []
+    while parents[index] >= 0:
+        path.append(names[index])
+        index = parents[index]
+    return "\\".join(reversed(path))
+
+
+def add_tree_hotspots(tops, translation_unit, tree, self_time=False):
+    """Pushes every node of tree but its root to each TopK of tops, ranked by inclusive or self time."""
+    names, paths, parents, depths, durations = get_tree_columns(tree)
+    self_times = aggregate_tree(parents, durations).self_duration
+    times = self_times if self_time else durations
+    threshold = min(top.threshold for top in tops)
+    for index in range(1, len(names)):
+        # Most nodes are below the threshold once the heaps are full, and cost a single comparison.
+        if times[index] > threshold:
+            hotspot = Hotspot(translation_unit, get_tree_path(names, parents, index), durations[index], self_times[index])
+            for top in tops:
+                top.push(times[index], hotspot)
+            threshold = min(top.threshold for top in tops)
+
+
+class HotspotReport:
+    """Slowest nodes of every category over a whole build, fed one record at a time.
+
+    counts maps a category to its K, categories that are left out aren't ranked. With per_tu_count,
+    add_record also returns the slowest nodes of the record itself.
+    """
+
+    def __init__(self, counts, per_tu_count=0, self_time=False):
+        self.tops = {category: TopK(count) for category, count in counts.items()}
+        self.per_tu_count = per_tu_count
+        self.self_time = self_time
+
+    def add_record(self, record):
+        """Ranks the nodes of a LogRecord or a TimingFile. Returns its own ranking ( category -> ( time, Hotspot ) pairs ),
+        or None without per_tu_count."""
+        translation_unit = record.name
+        trees = dict(zip(CATEGORIES, (record.headers, record.classes, record.functions)))
+        record_tops = {}
+        for category, top in self.tops.items():
+            tops = [top]
+            if self.per_tu_count:
+                record_tops[category] = TopK(self.per_tu_count)
+                tops.append(record_tops[category])
+            if trees.get(category) is not None:
+                add_tree_hotspots(tops, translation_unit, trees[category], self.self_time)
+
+        if self.per_tu_count:
+            return {category: top.get_items() for category, top in record_tops.items()}
+        return None
+
+    def add_tree(self, category, name, tree):
+        """Ranks the nodes of a single tree under any category, e.g. the linker passes of a binary. Does nothing
+        for categories that aren't ranked."""
+        top = self.tops.get(category)
+        if top is not None and tree is not None:
+            add_tree_hotspots([top], name, tree, self.self_time)
+
+    def get_results(self):
+        """Returns the ranking of every category: category -> ( time, Hotspot ) pairs, slowest first."""
+        return {category: top.get_items() for category, top in self.tops.items()}
+
+
+def print_hotspots(results, indent=""):
+    for category, items in results.items():
+        print("{}{}:".format(indent, category.capitalize()))
+        for time, hotspot in items:
+            print("{}  {:10.3f}s  self {:.3f}s  {}: {}".format(indent, time, hotspot.self_time, hotspot.translation_unit, hotspot.path))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Lists the slowest headers, classes and functions of a build.")
+    parser.add_argument("path", help="log, .cpp.timing.txt file or folder of them, - reads a log from stdin")
+    parser.add_argument("-n", "--count", type=int, default=20, help="default number of nodes listed per category (default: 20)")
+    for category in CATEGORIES:
+        parser.add_argument("--" + category, type=int, metavar="K", help="number of {} listed, 0 skips them".format(category))
+    parser.add_argument("--per-tu", type=int, default=0, metavar="K",
+                        help="also list the K slowest nodes of every category of each file as it is parsed")
+    parser.add_argument("--self", action="store_true", dest="self_time", help="rank nodes by self time instead of inclusive time")
+    return parser.parse_args()
+
+
+def main():
+    # main.py uses this module for its own report, so the parsers are only imported when running standalone.
+    import compile_times
+
+    arguments = parse_arguments()
+    counts = {}
+    for category in CATEGORIES:
+        count = getattr(arguments, category)
+        counts[category] = arguments.count if count is None else count
+
+    report = HotspotReport({category: count for category, count in counts.items() if count > 0}, arguments.per_tu, arguments.self_time)
+    for record in compile_times.iter_records(arguments.path, compact=True):
+        record_results = report.add_record(record)
+        if record_results:
+            print("{}:".format(record.name))
+            print_hotspots(record_results, "  ")
+
+    print("Slowest nodes of the build by {} time:".format("self" if arguments.self_time else "inclusive"))
+    print_hotspots(report.get_results())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Instrumentation of the current run, if one was started. Phases and counts are ignored otherwise,
+# which is always the case in worker processes.
+_active = None
+
+# Allocation sites listed in the summary when tracing memory.
+TRACEMALLOC_TOP_COUNT = 20
+
+
+def get_peak_rss(children=False):
+    """Returns the peak resident set size in bytes of this process ( or of its largest finished child ), None if unknown."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS and in kilobytes everywhere else.
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    if sys.platform == "win32" and not children:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + \
+                [(name, ctypes.c_size_t) for name in ("PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                                                      "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage",
+                                                      "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess
+        process.restype = wintypes.HANDLE
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+
+    return None
+
+
+class Phase:
+    """Accumulated timings of every run of a phase."""
+
+    __slots__ = ("wall_seconds", "cpu_seconds", "calls")
+
+    def __init__(self):
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.calls = 0
+
+
+class Instrumentation:
+    """Wall and CPU time of named phases, counts of processed lines, nodes, bytes..., and peak memory of a run.
+
+    Phases can nest, a nested phase is named after its parents ( e.g. "parse/aggregate" ) and its time
+    is also part of theirs. profile_path dumps cProfile stats there, trace_memory records the traced peak
+    and the largest allocation sites alive at the end using tracemalloc. Both slow the run down noticeably.
+    """
+
+    def __init__(self, profile_path=None, trace_memory=False):
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.profiler = None
+        self.phases = {}
+        self.counts = {}
+        self.stack = []
+        self.start_time = None
+        self.start_wall = 0.0
+        self.start_cpu = 0.0
+        self.start_children_cpu = 0.0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.children_cpu_seconds = 0.0
+        self.tracemalloc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Starts timing the run and makes this the instance the module level phase and count functions report to."""
+        global _active
+        _active = self
+
+        if self.trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile_path:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        times = os.times()
+        self.start_time = datetime.datetime.now().astimezone()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.start_children_cpu = times.children_user + times.children_system
+
+    def stop(self):
+        global _active
+        if _active is not self:
+            return
+        _active = None
+
+        times = os.times()
+        self.wall_seconds = time.perf_counter() - self.start_wall
+        self.cpu_seconds = time.process_time() - self.start_cpu
+        self.children_cpu_seconds = times.children_user + times.children_system - self.start_children_cpu
+
+        if self.profiler:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+        if self.trace_memory:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            self.tracemalloc = {
+                "peak_bytes": tracemalloc.get_traced_memory()[1],
+                "top": [{"location": str(statistic.traceback), "bytes": statistic.size, "blocks": statistic.count}
+                        for statistic in snapshot.statistics("lineno")[:TRACEMALLOC_TOP_COUNT]],
+            }
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the enclosed code as name, nested in the phases currently running."""
+        self.stack.append(name)
+        phase = self.phases.setdefault("/".join(self.stack), Phase())
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            phase.wall_seconds += time.perf_counter() - start_wall
+            phase.cpu_seconds += time.process_time() - start_cpu
+            phase.calls += 1
+            self.stack.pop()
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def get_summary(self):
+        """Returns the results of the run as a dictionary of JSON types. Must be called after stop."""
+        summary = {
+            "command": sys.argv,
+            "started": self.start_time.isoformat() if self.start_time else None,
+            "python": sys.version.split()[0],
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            # CPU time of worker processes, counted once they are joined.
+            "children_cpu_seconds": self.children_cpu_seconds,
+            "peak_rss_bytes": get_peak_rss(),
+            "children_peak_rss_bytes": get_peak_rss(children=True),
+            "phases": {name: {"wall_seconds": phase.wall_seconds, "cpu_seconds": phase.cpu_seconds, "calls": phase.calls}
+                       for name, phase in self.phases.items()},
+            "counts": dict(self.counts),
+        }
+        if self.profile_path:
+            summary["profile"] = os.path.abspath(self.profile_path)
+        if self.tracemalloc:
+            summary["tracemalloc"] = self.tracemalloc
+        return summary
+
+    def write_summary(self, path):
+        """Writes get_summary as JSON to path, or to stdout if path is "-"."""
+        if path == "-":
+            json.dump(self.get_summary(), sys.stdout, indent=4)
+            print()
+        else:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(self.get_summary(), file, indent=4)
+
+
+def phase(name):
+    """Times the enclosed code as name if an Instrumentation is running, does nothing otherwise."""
+    return _active.phase(name) if _active else contextlib.nullcontext()
+
+
+def count(name, amount=1):
+    """Adds amount to the count called name if an Instrumentation is running."""
+    if _active:
+        _active.count(name, amount)
+
+
+def add_arguments(parser):
+    """Adds the --stats, --profile and --trace-memory options to an argparse parser."""
+    parser.add_argument("--stats", metavar="PATH",
+                        help="write a JSON summary of the time spent in every phase, processed counts and peak memory, - prints it")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="profile the run with cProfile and write the stats to PATH")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace allocations with tracemalloc, adding the peak and the largest allocation sites still alive at the end to the summary")
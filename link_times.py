@@ -0,0 +1,135 @@
+import ntpath
+
+from results_db import get_tree_columns
+
+# Lines printed by link.exe /time+, once the log prefix is removed.
+LINKER_PREFIX = "Linker:"
+
+# Category of the linker pass trees in WizTree files and hotspot reports.
+LINK_CATEGORY = "links"
+
+# Name of the line holding the total time of a binary, which becomes the time of its root.
+LINK_TOTAL_NAME = "Final"
+
+
+def parse_linker_line(text):
+    """Parses a "Linker: Pass 1: Interval #1, time = 0.438s [C:\\Bin\\Foo.dll]" line, without the log prefix.
+
+    Returns ( binary path or None, level, name, time ), or None for lines without a time. level is 0 for
+    passes and grows by one every two spaces of indent after "Linker:". Names lose their trailing " Total",
+    so that "Final Total time = ..." is named Final.
+    """
+    text = text[len(LINKER_PREFIX):]
+    stripped = text.lstrip(" ")
+    head, separator, tail = stripped.partition("time = ")
+    if not separator:
+        return None
+
+    time = tail.split("s", 1)[0]
+    try:
+        time = float(time)
+    except ValueError:
+        return None
+
+    name = head.rstrip(" ,:")
+    if name.endswith(" Total"):
+        name = name[:-len(" Total")]
+    elif name == "Total":
+        name = LINK_TOTAL_NAME
+
+    binary = None
+    start = tail.rfind("[")
+    if start >= 0 and tail.rstrip().endswith("]"):
+        binary = tail[start + 1:tail.rindex("]")]
+
+    level = max(0, (len(text) - len(stripped) - 1) // 2)
+    return binary, level, name, time
+
+
+class LinkPasses:
+    """Passes printed by the linker for a single binary, over every link of it.
+
+    A binary linked several times prints the same passes again, passes with the same name under the same parent
+    are merged and their times added up. Every pass is a [time, children] list, children mapping names to passes.
+    """
+
+    __slots__ = ("root", "stack", "total", "pending")
+
+    def __init__(self):
+        self.root = [0.0, {}]
+        # Passes from the root down to the last pass added.
+        self.stack = [self.root]
+        # Sum of the totals printed by the linker, and of the top level passes added since the last total.
+        self.total = 0.0
+        self.pending = 0.0
+
+    def add(self, level, name, time):
+        """Adds a pass parsed by parse_linker_line, the Final total ending the current link."""
+        if level == 0 and name == LINK_TOTAL_NAME:
+            self.total += time
+            self.pending = 0.0
+            return
+        if level == 0:
+            self.pending += time
+
+        del self.stack[level + 1:]
+        children = self.stack[-1][1]
+        node = children.get(name)
+        if node is None:
+            node = children[name] = [0.0, {}]
+        node[0] += time
+        self.stack.append(node)
+
+    def merge(self, other):
+        """Adds the passes of other, the same binary parsed from another part of the log."""
+        self.total += other.total
+        self.pending += other.pending
+        stack = [(self.root, other.root)]
+        while stack:
+            node, other_node = stack.pop()
+            for name, other_child in other_node[1].items():
+                child = node[1].get(name)
+                if child is None:
+                    child = node[1][name] = [0.0, {}]
+                child[0] += other_child[0]
+                stack.append((child, other_child))
+
+    def get_nodes(self, name):
+        """Returns ( name, time, depth ) of the root, named name, and of every pass in pre order.
+
+        The linker rounds times to the millisecond and its intervals can overlap, so the passes of a node can add
+        up to more than its own time. Every node takes at least the time of its children, which keeps self times positive.
+        """
+        nodes = []
+
+        def add_node(name, node, depth, time):
+            index = len(nodes)
+            nodes.append(None)
+            children_time = sum(add_node(child_name, child, depth + 1, child[0]) for child_name, child in node[1].items())
+            time = max(time, children_time)
+            nodes[index] = (name, time, depth)
+            return time
+
+        add_node(name, self.root, 0, self.total + self.pending)
+        return nodes
+
+
+def get_wiztree_parent(binary):
+    """Returns the parent path of the WizTree rows of a binary's tree. Binaries are named after their full path,
+    which already starts with a drive most of the time."""
+    return "" if ntpath.splitdrive(binary)[0] else "C:\\"
+
+
+def print_link_times(links, count=20):
+    """Prints the count slowest binaries to link and the time of each of their passes. links maps binaries to trees."""
+    items = []
+    for binary, tree in links.items():
+        names, paths, parents, depths, durations = get_tree_columns(tree)
+        items.append((durations[0], binary, names, depths, durations))
+    items.sort(key=lambda item: item[0], reverse=True)
+
+    print("{} binaries linked in {:.3f}s".format(len(items), sum(item[0] for item in items)))
+    for total, binary, names, depths, durations in items[:count]:
+        print("  {:8.3f}s  {}".format(total, binary))
+        for index in range(1, len(names)):
+            print("  {}{:8.3f}s  {}".format("  " * depths[index], durations[index], names[index]))
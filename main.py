@@ -1,19 +1,40 @@
+import argparse
+import gc
+import io
+import multiprocessing
 import operator
+import os
+import re
 import sys
-from collections import deque
-
-if len(sys.argv) < 2:
-    import tkinter as tk
-    from tkinter import filedialog
-
-    root = tk.Tk()
-    root.withdraw()
-
-    log_file = filedialog.askopenfilename(title="Select log file")
-else:
-    log_file = sys.argv[1]
-
-dest_files = "result" if len(sys.argv) < 3 else sys.argv[2]
+from collections import deque, namedtuple
+
+import instrumentation
+from codegen import CodeGenStats, parse_anomalous_function, parse_hits_line, parse_time_line, print_codegen_report
+from compression import get_compression, open_text
+from header_index import HeaderIndex
+from hotspots import CATEGORIES, HotspotReport, print_hotspots
+from instrumentation import Instrumentation
+from link_times import LINK_CATEGORY, LINKER_PREFIX, LinkPasses, get_wiztree_parent, parse_linker_line, print_link_times
+from results_db import ResultsDatabase
+from shards import ShardWriter
+from symbols import SYMBOLS
+from timing_tree import CompactTree, OtherBuckets, aggregate_tree, flatten_tree
+from trace_export import TRACE_FILE_BYTES, TraceWriter
+from wiztree import WIZTREE_ROW, WizTreeWriter
+
+# Prefix every timing line starts with and whitespace width of a section's "Count:" line, per log type.
+LOG_CONFIGURATIONS = {
+    "Unreal": ("ParallelExecutor.ExecuteActions:", 4),
+    "Qt": ("", 1),
+    "MSVC": ("", 3),
+}
+
+# Consecutive translation units are handed to parsing workers in chunks of roughly this many bytes.
+LOG_CHUNK_BYTES = 4 * 1024 * 1024
+
+# "[n/N] " header of an action, after the log prefix. Tree lines are indented with tabs, and function names
+# such as "[thunk]:Foo::Bar" can start with a bracket too, so neither is mistaken for an action.
+ACTION_LINE = re.compile(rb" *\[\d+/\d+\] ")
 
 def print_debug(*args, **kwargs):
     # print(*args, **kwargs)
@@ -42,7 +63,13 @@ def query_yes_no(question, default="yes"):
 
     while True:
         sys.stdout.write(question + prompt)
-        choice = input().lower()
+        try:
+            choice = input().lower()
+        except EOFError:
+            # stdin was used for the log itself
+            if default is None:
+                raise
+            return valid[default]
         if default is not None and choice == '':
             return valid[default]
         elif choice in valid:
@@ -51,31 +78,27 @@ def query_yes_no(question, default="yes"):
             sys.stdout.write("Please respond with 'yes' or 'no' "
                              "(or 'y' or 'n').\n")
 
-def wiztree_internal(filename, size, allocated, modified, attributes, files, folders):
-    assert 0 <= files
-    assert 0 <= folders
-    assert 0 <= size
-
-    return '"{}",{},{},{},{},{},{}'.format(filename.replace('"', ''),
-                                           size,
-                                           allocated,
-                                           modified,
-                                           attributes,
-                                           files,
-                                           folders)
-
+def wiztree(path, time, selftime, num_children):
+    """Returns the rows of a tree node and of its self time. 1s is written as 1MB."""
+    assert 0 <= time
+    assert 0 <= selftime, selftime
+    assert selftime <= time
+    assert 0 < num_children
 
-def wiztree(filename, size, num_children=0):
-    size = int(size * 1000000)
-    return wiztree_internal(filename, size, size, "2019/01/01 00:00:00", 0, num_children, max(0, num_children - 1))
+    size = int(time * 1000000)
+    selfsize = int(selftime * 1000000)
+    return (WIZTREE_ROW % (path, size, size, num_children, num_children - 1),
+            WIZTREE_ROW % (path + "self", selfsize, selfsize, 0, 0))
 
 
 class Tree:
-    def __init__(self, name, time, indent):
+    def __init__(self, name, time, indent, path=None):
         assert 0 <= time
         self.name = name
         self.time = time
         self.indent = indent
+        # Full path of a header whose name is its file name.
+        self.path = path
         self.children = []
 
     def __str__(self):
@@ -84,74 +107,189 @@ class Tree:
             string += "\n" + str(child)
         return string
 
+    def __reduce__(self):
+        # Pickling nested objects is slower than parsing the log in the first place,
+        # so trees travel to and from worker processes as flat pre-order lists.
+        nodes = []
+        stack = [self]
+        while stack:
+            tree = stack.pop()
+            nodes.append((tree.name, tree.time, tree.indent, tree.path))
+            stack.extend(reversed(tree.children))
+        return make_tree, (nodes,)
+
     def compute_num_children(self):
-        self.num_children = 1 + sum([child.compute_num_children() for child in self.children])
+        """Caches num_children ( subtree size ) and selftime of every node."""
+        trees, parents = flatten_tree(self)
+        aggregates = aggregate_tree(parents, [tree.time for tree in trees])
+        for tree, child_count, selftime in zip(trees, aggregates.child_count, aggregates.self_duration):
+            tree.num_children = child_count + 1
+            tree.selftime = selftime
         return self.num_children
 
-    def to_wiztree(self, file, parent="C:\\"):
-        path = parent + self.name + "\\"
-        selftime = self.time - sum([child.time for child in self.children])
+    def get_wiztree_rows(self, parent="C:\\"):
+        rows = []
+        stack = [(self, parent)]
+        while stack:
+            tree, parent = stack.pop()
+            path = parent + tree.name.replace('"', '') + "\\"
+            selftime = tree.selftime
 
-        if -1e-3 < selftime < 0:
-            selftime = 0
+            if -1e-3 < selftime < 0:
+                selftime = 0
 
-        assert 0 <= self.time
-        assert 0 <= selftime, selftime
-        assert selftime <= self.time
-        assert 0 < self.num_children
+            rows.extend(wiztree(path, tree.time, selftime, tree.num_children))
 
-        file.write(wiztree(path, self.time, self.num_children) + "\n")
-        file.write(wiztree(path + "self", selftime) + "\n")
+            stack.extend((child, path) for child in reversed(tree.children))
+        return rows
 
-        for child in self.children:
-            child.to_wiztree(file, path)
 
+def make_tree(nodes):
+    """Rebuilds a Tree from the (name, time, indent, path) pre-order list made by Tree.__reduce__."""
+    trees = [Tree(*node) for node in nodes]
+    stack = []
+    for tree in trees:
+        while stack and stack[-1].indent >= tree.indent:
+            stack.pop()
+        if stack:
+            stack[-1].children.append(tree)
+        stack.append(tree)
+    return trees[0]
 
-map = {}
-headers = {}
 
-with open(log_file, "r", encoding="utf-8-sig") as file:
-    line = file.readline()
-    file.seek(0)
+class CompactLogTree(CompactTree):
+    """Tree stored as a CompactTree, with the interface of Tree. Needs cache_useful_data once fully parsed."""
 
-    if "Unreal" in line:
-        configuration = "Unreal"
-        prefix = "ParallelExecutor.ExecuteActions:"
-        default_indent = 4
-    elif "Qt" in line:
-        configuration = "Qt"
-        prefix = ""
-        default_indent = 1
-    else:
-        configuration = "MSVC"
-        prefix = ""
-        default_indent = 3
+    def __init__(self, name, time):
+        super().__init__(name, time)
+
+    @property
+    def name(self):
+        return self.get_data(0)
 
-    print("{} log file detected".format(configuration))
+    @property
+    def time(self):
+        return self.duration[0]
 
+    @time.setter
+    def time(self, time):
+        self.duration[0] = time
 
-    def get_line():
-        line = file.readline()
-        assert line.startswith(prefix), "{} does not start with {}".format(line, prefix)
-        return line[len(prefix):]
+    @property
+    def children(self):
+        return self.root.children
 
+    def compute_num_children(self):
+        self.num_children = self.child_count[0] + 1
+        return self.num_children
+
+    def get_wiztree_rows(self, parent="C:\\"):
+        rows = []
+        paths = []
+        for index in range(len(self)):
+            del paths[self.depth[index]:]
+            path = (paths[-1] if paths else parent) + self.get_data(index).replace('"', '') + "\\"
+            paths.append(path)
+
+            selftime = self.self_duration[index]
+            if -1e-3 < selftime < 0:
+                selftime = 0
+
+            rows.extend(wiztree(path, self.duration[index], selftime, self.child_count[index] + 1))
+        return rows
+
+
+class LogRecord(namedtuple("LogRecord", ["path", "headers", "classes", "functions", "codegen"], defaults=[None])):
+    """Parsed timing output of a single action. headers, classes and functions are trees, or None for empty sections.
+    codegen holds the CodeGenStats printed after the trees."""
+    __slots__ = ()
 
-    def get_line_for_try():
-        last_pos = file.tell()
-        line = file.readline()
-        file.seek(last_pos)
-        assert line.startswith(prefix), "{} does not start with {}".format(line, prefix)
-        return line[len(prefix):]
+    @property
+    def name(self):
+        return self.path
 
 
-    def parse_int(string):
-        line = get_line().strip()
+class LineReader:
+    """Reads a file, pipe or stdin in a single forward pass. Upcoming lines can be peeked at without seeking."""
+
+    def __init__(self, file):
+        self.lines = iter(file)
+        self.buffer = deque()
+        # Lines and characters returned by readline so far.
+        self.line_count = 0
+        self.char_count = 0
+
+    def readline(self):
+        """Returns the next line, or an empty string once the input is exhausted."""
+        line = self.buffer.popleft() if self.buffer else next(self.lines, "")
+        if line:
+            self.line_count += 1
+            self.char_count += len(line)
+        return line
+
+    def peek(self, index=0):
+        """Returns the line readline would return after index more calls, without consuming anything."""
+        while len(self.buffer) <= index:
+            self.buffer.append(next(self.lines, ""))
+        return self.buffer[index]
+
+
+def detect_configuration(line):
+    """Returns the name of the LOG_CONFIGURATIONS entry matching the first line of a log."""
+    if "Unreal" in line:
+        return "Unreal"
+    elif "Qt" in line:
+        return "Qt"
+    else:
+        return "MSVC"
+
+
+class LogParser:
+    """Parses the timing output of every action of a log, either lazily with iter_records
+    or with parse into map (file -> trees) and codegen (file -> CodeGenStats).
+    header_counts (symbol id -> count, see headers) and links (binary -> tree of linker passes) are filled either way."""
+
+    def __init__(self, reader, configuration, verbose=True, compact=False, min_time=0.0, partial_input=False):
+        self.reader = reader
+        self.configuration = configuration
+        self.prefix, self.default_indent = LOG_CONFIGURATIONS[configuration]
+        self.verbose = verbose
+        self.compact = compact
+        # Nodes shorter than this many seconds are collapsed into an "other" node per parent.
+        self.min_time = min_time
+        # The input may end in the middle of an action, e.g. a log still being written. Such an action is
+        # left out instead of failing to parse, see is_action_complete.
+        self.partial_input = partial_input
+        self.map = {}
+        self.codegen = {}
+        # Binary path -> tree of its linker passes, made from link_passes once the whole log is parsed.
+        self.links = {}
+        # Binary path -> LinkPasses, see add_linker_line.
+        self.link_passes = {}
+        # Binary of the last linker line, for lines that don't name it.
+        self.link_binary = None
+        # Symbol id of a header file name -> number of times it was included.
+        self.header_counts = {}
+        # Nodes of every tree parsed so far, roots included.
+        self.node_count = 0
+
+    def get_line(self):
+        line = self.reader.readline()
+        assert line.startswith(self.prefix), "{} does not start with {}".format(line, self.prefix)
+        return line[len(self.prefix):]
+
+    def get_line_for_try(self):
+        line = self.reader.peek()
+        assert line.startswith(self.prefix), "{} does not start with {}".format(line, self.prefix)
+        return line[len(self.prefix):]
+
+    def parse_int(self, string):
+        line = self.get_line().strip()
         assert string in line, "{} not in {}".format(string, line)
         return int(line.split(string)[1])
 
-
-    def parse_float(string, suffix):
-        line = get_line().strip()
+    def parse_float(self, string, suffix):
+        line = self.get_line().strip()
         assert string in line, "{} not in {}".format(string, line)
         assert line.endswith(suffix), "{} does not end with {}".format(line, suffix)
         line = line.split(string)[1][:-len(suffix)].strip()
@@ -160,271 +298,693 @@ with open(log_file, "r", encoding="utf-8-sig") as file:
         else:
             return float(line)
 
+    def parse_count(self):
+        return self.parse_int("Count:")
 
-    def parse_count():
-        return parse_int("Count:")
-
-
-    def parse_total():
-        return parse_float("Total:", "s")
-
-
-    def parse_seconds(string):
-        return parse_float(string, " sec")
+    def parse_total(self):
+        return self.parse_float("Total:", "s")
 
+    def parse_seconds(self, string):
+        return self.parse_float(string, " sec")
 
-    def parse_empty():
-        empty = get_line().strip()
+    def parse_empty(self):
+        empty = self.get_line().strip()
         assert empty == "", empty
 
-
-    def parse_top():
-        top = get_line().strip()
+    def parse_top(self):
+        top = self.get_line().strip()
         assert "(top-level only):" in top, "(top-level only) not in " + top
         assert "Top" in top, "Top not in " + top
         return int(top.split("Top")[1].split("(top-level only):")[0])
 
-
-    def parse_string(string):
-        line = get_line().strip()
+    def parse_string(self, string):
+        line = self.get_line().strip()
         assert line == string, line + "!=" + string
 
-
-    def try_parse_string(string):
-        line = get_line_for_try().strip()
+    def try_parse_string(self, string):
+        line = self.get_line_for_try().strip()
         if line == string:
-            parse_string(string)
+            self.parse_string(string)
             return True
         else:
             return False
 
-
-    def try_parse_int(string):
-        line = get_line_for_try().strip()
+    def try_parse_int(self, string):
+        line = self.get_line_for_try().strip()
         if string not in line:
             return 0
         else:
-            return parse_int(string)
-
+            return self.parse_int(string)
 
-    def try_parse_float(string, suffix):
-        line = get_line_for_try().strip()
+    def try_parse_float(self, string, suffix):
+        line = self.get_line_for_try().strip()
         if string not in line:
             return 0
         else:
-            return parse_float(string, suffix)
-
+            return self.parse_float(string, suffix)
 
-    def try_parse_seconds(string):
-        return try_parse_float(string, " sec")
+    def try_parse_seconds(self, string):
+        return self.try_parse_float(string, " sec")
 
-
-    def try_parse_empty():
-        line = get_line_for_try().strip()
+    def try_parse_empty(self):
+        line = self.get_line_for_try().strip()
         if line == "":
-            parse_empty()
+            self.parse_empty()
             return True
         else:
             return False
 
-
-    def parse_beginstring(string):
-        line = get_line().strip()
+    def parse_beginstring(self, string):
+        line = self.get_line().strip()
         assert line.startswith(string), "{} does not start with {}".format(line, string)
-
-
-    def parse_tree(count, current_file, getname=lambda x: x):
+        return line
+
+    def parse_time(self):
+        """Parses a "time(...dll)=1.234s ..." line, returns its seconds."""
+        return parse_time_line(self.parse_beginstring("time("))
+
+    def parse_elapsed_time(self, string):
+        """Parses a line starting with string and followed by seconds, returns 0 if they can't be read."""
+        value = self.parse_beginstring(string)[len(string):].split()
+        try:
+            return float(value[0]) if value else 0.0
+        except ValueError:
+            return 0.0
+
+    def parse_tree_line(self, line):
+        """Splits a tree line into its indent, name and time, checking every part. parse_tree only
+        uses it for lines that its fast path can't handle."""
+        assert line.startswith(self.prefix), "{} does not start with {}".format(line, self.prefix)
+        include = line[len(self.prefix):]
+        assert include[-1] == "\n", include
+        include = include[:-1]
+
+        indent = len(include.split(include.lstrip()[0])[0])
+
+        include_time = include.split(":")[-1].strip()
+        assert include_time[-1] == "s", "Wrong time: " + include_time
+
+        return indent, include.split(include_time)[0].strip()[:-1], float(include_time[:-1])
+
+    def add_other_node(self, tree, queue, others):
+        """Adds the children collapsed under the last node of queue, if any, as a single child."""
+        other = others.pop(len(queue) - 1)
+        if other is not None:
+            name, time = other
+            if self.compact:
+                tree.add_symbol_node(queue[-1], SYMBOLS.intern(name), time)
+            else:
+                queue[-1].children.append(Tree(name, time, len(queue)))
+            self.node_count += 1
+
+    def parse_tree(self, count, current_file, get_name_id=None, keep_path=False):
+        """Parses count tree lines. Names are interned in SYMBOLS, get_name_id optionally maps
+        the symbol id of a line's name to the id of the name that is actually stored.
+        Nodes shorter than min_time are collapsed along with their children, see OtherBuckets.
+        Their names are only interned to be passed to get_name_id, which counts headers."""
+        names = SYMBOLS.names
+        symbol_ids = SYMBOLS.ids
+        readline = self.reader.readline
+        prefix = self.prefix
+        prefix_length = len(prefix)
+        default_indent = self.default_indent
+        min_time = self.min_time
+        others = OtherBuckets(min_time)
+        # Lines indented deeper than this belong to a collapsed node, 0 when no node is being skipped.
+        skip_indent = 0
         current_indent = 0
-        tree = Tree(current_file, 0, 0)
-        queue = deque([tree])
+        if self.compact:
+            tree = CompactLogTree(current_file, 0)
+            queue = deque([0])
+        else:
+            tree = Tree(current_file, 0, 0)
+            queue = deque([tree])
         for _ in range(count):
-            include = get_line()
-            assert include[-1] == "\n", include
-            include = include[:-1]
-
-            indent = len(include.split(include.lstrip()[0])[0]) - default_indent
+            line = readline()
+            # Fast path for well formed lines ( prefix, indent, "name: 0.123s" ), split by string methods running in C.
+            head, separator, include_time = line.rpartition(": ")
+            name = head[prefix_length:].lstrip(" \t")
+            if separator and include_time[-2:] == "s\n" and name and line.startswith(prefix):
+                indent = len(head) - prefix_length - len(name) - default_indent
+                include_time = float(include_time[:-2])
+            else:
+                indent, name, include_time = self.parse_tree_line(line)
+                indent -= default_indent
             assert indent > 0, "Wrong indent: default indent should be {}".format(indent + default_indent - 1)
 
-            include_time = include.split(":")[-1].strip()
-            assert include_time[-1] == "s", "Wrong time: " + include_time
-
-            include_name = getname(include.split(include_time)[0].strip()[:-1])
-            include_time = float(include_time[:-1])
+            if skip_indent:
+                if indent > skip_indent:
+                    if get_name_id:
+                        get_name_id(SYMBOLS.intern(name))
+                    continue
+                skip_indent = 0
 
             if indent > current_indent:
                 assert current_indent + 1 == indent, "Going from {} indents to {}".format(current_indent, indent)
             else:
                 for _ in range(current_indent - indent + 1):
+                    if others.buckets:
+                        self.add_other_node(tree, queue, others)
                     queue.pop()
 
-            new_tree = Tree(include_name, include_time, indent)
             assert len(queue) > 0, "Wrong indent level"
-            queue[-1].children.append(new_tree)
+            if include_time < min_time:
+                if get_name_id:
+                    get_name_id(SYMBOLS.intern(name))
+                others.add(len(queue) - 1, include_time)
+                skip_indent = indent
+                current_indent = indent - 1
+                continue
+
+            path_id = symbol_ids.get(name)
+            if path_id is None:
+                path_id = SYMBOLS.intern(name)
+            name_id = get_name_id(path_id) if get_name_id else path_id
+            if not keep_path:
+                path_id = -1
+
+            self.node_count += 1
+            if self.compact:
+                new_tree = tree.add_symbol_node(queue[-1], name_id, include_time, path_id)
+            else:
+                new_tree = Tree(names[name_id], include_time, indent, names[path_id] if path_id >= 0 else None)
+                queue[-1].children.append(new_tree)
             queue.append(new_tree)
             current_indent = indent
 
             assert len(queue) == current_indent + 1
-        return tree
 
+        while others.buckets:
+            self.add_other_node(tree, queue, others)
+            queue.pop()
+        return tree
 
-    def get_include_name(include_name):
-        include_name = include_name.split("\\")[-1]
-        if include_name not in headers:
-            headers[include_name] = 0
-        headers[include_name] += 1
-        return include_name
+    def get_include_name_id(self, path_id):
+        """Returns the symbol id of the file name of an include and counts it."""
+        name_id = SYMBOLS.intern_basename(path_id)
+        self.header_counts[name_id] = self.header_counts.get(name_id, 0) + 1
+        return name_id
 
+    @property
+    def headers(self):
+        """Number of times every header file name was included."""
+        return {SYMBOLS.names[name_id]: count for name_id, count in self.header_counts.items()}
 
-    def parse_section(current_file, getname=lambda x: x):
+    def parse_section(self, current_file, get_name_id=None, keep_path=False):
         tree = None
-        count = parse_count()
+        count = self.parse_count()
         print_debug("    Parsing {} items...".format(count))
         if count > 0:
-            tree = parse_tree(count, current_file, getname)
+            tree = self.parse_tree(count, current_file, get_name_id, keep_path)
 
-            parse_empty()
+            self.parse_empty()
 
-            for _ in range(parse_top()):
-                file.readline()
-        parse_empty()
-        total = parse_total()
+            for _ in range(self.parse_top()):
+                self.reader.readline()
+        self.parse_empty()
+        total = self.parse_total()
         if tree is not None:
             tree.time = total
+            self.node_count += 1
+            if self.compact:
+                with instrumentation.phase("aggregate"):
+                    tree.cache_useful_data()
         return tree
 
+    def parse_action(self, current_file):
+        """Parses the timing output of current_file and returns it as a LogRecord."""
+        self.try_parse_string("Unknown compiler version - please run the configure tests and report the results")
+        self.try_parse_string("Include Headers:")
 
-    while True:
-        line = file.readline()
-        if len(line) == 0:
-            assert len(file.readline()) == 0
-            break
-
-        if not line.startswith(prefix):
-            continue
-        line = line[len(prefix):]
-
-        if configuration == "Unreal":
-            if not line.lstrip().startswith("["):
-                print("Skipping line " + line.strip())
+        print_debug("    Parsing includes...")
+        includes_tree = self.parse_section(current_file, self.get_include_name_id, keep_path=True)
+        print_debug("    Includes parsed!")
+
+        self.parse_string("Class Definitions:")
+
+        print_debug("    Parsing classes...")
+        classes_tree = self.parse_section(current_file)
+        print_debug("    Classes parsed!")
+
+        self.parse_string("Function Definitions:")
+
+        print_debug("    Parsing functions...")
+        functions_tree = self.parse_section(current_file)
+        print_debug("    Functions parsed!")
+
+        stats = CodeGenStats()
+        stats.frontend_time = self.parse_time()
+        stats.elapsed_before_codegen = self.parse_elapsed_time("Elapsed Time before Code Generation:")
+
+        if self.try_parse_string("Code Generation Summary"):
+            stats.function_count = self.parse_int("Total Function Count:")
+            stats.codegen_time = self.parse_seconds("Elapsed Time:")
+            stats.total_compilation_time = self.parse_seconds("Total Compilation Time:")
+            stats.average_function_time = self.parse_seconds("Average time per function:")
+            for _ in range(self.try_parse_int("Anomalistic Compile Times:")):
+                function = parse_anomalous_function(self.get_line())
+                if function is not None:
+                    stats.anomalous_functions.append(function)
+            stats.serialized_initializer_count = self.try_parse_int("Serialized Initializer Count:")
+            stats.serialized_initializer_time = self.try_parse_seconds("Serialized Initializer Time:")
+            self.parse_empty()
+
+        if self.try_parse_string("RdrReadProc Caching Stats"):
+            stats.functions_cached = self.parse_int("Functions Cached:")
+            stats.retrieved_count = self.parse_int("Retrieved Count:")
+            stats.abandoned_retrieval_count = self.parse_int("Abandoned Retrieval Count:")
+            stats.abandoned_caching_count = self.parse_int("Abandoned Caching Count:")
+            stats.wasted_caching_attempts = self.parse_int("Wasted Caching Attempts:")
+            stats.functions_retrieved = self.parse_int("Functions Retrieved at Least Once:")
+            stats.functions_never_retrieved = self.parse_int("Functions Cached and Never Retrieved:")
+            self.parse_string("Most Hits:")
+            while not self.try_parse_empty():
+                hits = parse_hits_line(self.get_line())
+                if hits is not None:
+                    stats.most_hits.append(hits)
+            self.parse_string("Least Hits:")
+            while not self.try_parse_empty():
+                hits = parse_hits_line(self.get_line())
+                if hits is not None:
+                    stats.least_hits.append(hits)
+
+        stats.elapsed_after_codegen = self.parse_elapsed_time("Elapsed Time after Code Generation:")
+        stats.backend_time = self.parse_time()
+
+        print_debug("")
+
+        return LogRecord(current_file, includes_tree, classes_tree, functions_tree, stats)
+
+    def add_linker_line(self, text):
+        """Adds a pass printed by the linker ( /time+ ) to the LinkPasses of its binary, binaries are named after their full path."""
+        parsed = parse_linker_line(text)
+        if parsed is None:
+            return
+        binary, level, name, time = parsed
+        if binary is not None:
+            self.link_binary = binary
+        elif self.link_binary is None:
+            return
+        passes = self.link_passes.get(self.link_binary)
+        if passes is None:
+            passes = self.link_passes[self.link_binary] = LinkPasses()
+        passes.add(level, name, time)
+
+    def is_action_complete(self):
+        """Returns True if the input holds the whole action starting at the next line, that is up to its second
+        time( line ( c1xx.dll then c2.dll ). Looks ahead without consuming anything."""
+        prefix_length = len(self.prefix)
+        time_lines = 0
+        index = 0
+        while time_lines < 2:
+            line = self.reader.peek(index)
+            if not line:
+                return False
+            if line[prefix_length:].lstrip().startswith("time("):
+                time_lines += 1
+            index += 1
+        return True
+
+    def parse(self):
+        for record in self.iter_records():
+            self.map[record.path] = record.headers, record.classes, record.functions
+            self.codegen[record.path] = record.codegen
+
+    def iter_records(self):
+        """Yields a LogRecord for every compiled file, parsing the log as they are requested.
+        Linker passes of the binaries are gathered along the way and turned into links at the end."""
+        while True:
+            line = self.reader.readline()
+            if len(line) == 0:
+                assert len(self.reader.readline()) == 0
+                break
+
+            if not line.startswith(self.prefix):
                 continue
-        elif configuration == "Qt":
-            if line[0] == "\t":
-                print("Skipping line " + line.strip())
+            line = line[len(self.prefix):]
+
+            if line.lstrip().startswith(LINKER_PREFIX):
+                self.add_linker_line(line.lstrip())
                 continue
 
-        extension = ""
-        for ext in [".h", ".cpp", ".rc", ".lib", ".dll", ".exe"]:
-            if ext in line:
-                extension = ext
-                break
-        else:
-            assert False, "Invalid file name: " + line
+            if self.configuration == "Unreal":
+                if not line.lstrip().startswith("["):
+                    if self.verbose:
+                        print("Skipping line " + line.strip())
+                    continue
+            elif self.configuration == "Qt":
+                if line[0] == "\t":
+                    if self.verbose:
+                        print("Skipping line " + line.strip())
+                    continue
+
+            extension = ""
+            for ext in [".h", ".cpp", ".rc", ".lib", ".dll", ".exe"]:
+                if ext in line:
+                    extension = ext
+                    break
+            else:
+                assert False, "Invalid file name: " + line
 
-        if configuration == "Unreal":
-            line = line.split("]")[1]
+            if self.configuration == "Unreal":
+                line = line.split("]")[1]
 
-        current_file = line.strip().split(extension)[0] + extension
-        print(current_file)
+            current_file = line.strip().split(extension)[0] + extension
+            if self.verbose:
+                print(current_file)
 
-        if extension in [".rc", ".lib", ".dll", ".exe"]:
-            print("Skipping extension " + extension)
-            continue
+            if extension in [".rc", ".lib", ".dll", ".exe"]:
+                if self.verbose:
+                    print("Skipping extension " + extension)
+                continue
 
-        try_parse_string("Unknown compiler version - please run the configure tests and report the results")
-        try_parse_string("Include Headers:")
+            if self.partial_input and not self.is_action_complete():
+                break
+            yield self.parse_action(current_file)
 
-        print_debug("    Parsing includes...")
-        includes_tree = parse_section(current_file, get_include_name)
-        print_debug("    Includes parsed!")
+        with instrumentation.phase("aggregate"):
+            for binary, passes in self.link_passes.items():
+                nodes = passes.get_nodes(binary)
+                self.links[binary] = make_link_tree(nodes, self.compact)
+                self.node_count += len(nodes)
 
-        parse_string("Class Definitions:")
 
-        print_debug("    Parsing classes...")
-        classes_tree = parse_section(current_file)
-        print_debug("    Classes parsed!")
+def iter_log_records(log, compact=False, min_time=0.0):
+    """Yields a LogRecord for every file compiled in an Unreal, MSVC or Qt log, parsing it lazily.
 
-        parse_string("Function Definitions:")
+    log is a path, "-" for stdin, or a text file object. Logs compressed with gzip, bzip2 or xz are decompressed as they are read.
+    Only the current record is held in memory. Nodes shorter than min_time seconds are collapsed, see LogParser.
+    """
+    if log == "-":
+        file = sys.stdin
+    elif isinstance(log, (str, os.PathLike)):
+        file = open_text(log)
+    else:
+        file = log
+
+    try:
+        reader = LineReader(file)
+        parser = LogParser(reader, detect_configuration(reader.peek()), verbose=False, compact=compact, min_time=min_time)
+        yield from parser.iter_records()
+    finally:
+        if file is not log and file is not sys.stdin:
+            file.close()
+
+
+def find_action_offsets(log_file, prefix):
+    """Returns the byte offset of every "[n/N] File.cpp" action line of an Unreal log."""
+    prefix = prefix.encode("utf-8")
+    offsets = []
+    offset = 0
+    with open(log_file, "rb") as file:
+        for line in file:
+            if line.startswith(prefix) and ACTION_LINE.match(line, len(prefix)):
+                offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+
+def make_log_chunks(offsets, size, chunk_bytes):
+    """Splits the byte range of a log at action offsets into (start, end) chunks of roughly chunk_bytes."""
+    chunks = []
+    start = 0
+    for offset in offsets:
+        if offset - start >= chunk_bytes:
+            chunks.append((start, offset))
+            start = offset
+    if start < size:
+        chunks.append((start, size))
+    return chunks
+
+
+def parse_log_chunk(chunk):
+    """Pool worker, parses the actions of a single chunk.
+    Returns (map items, headers, codegen items, link passes items, line count, character count, node count)."""
+    log_file, configuration, compact, min_time, start, end = chunk
+    with open(log_file, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    parser = LogParser(LineReader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig")), configuration, False, compact, min_time)
+    parser.parse()
+    return (list(parser.map.items()), parser.headers, list(parser.codegen.items()), list(parser.link_passes.items()),
+            parser.reader.line_count, parser.reader.char_count, parser.node_count)
+
+
+def make_link_tree(nodes, compact=False):
+    """Returns the Tree, or CompactLogTree with compact, of the ( name, time, depth ) nodes made by LinkPasses.get_nodes."""
+    if not compact:
+        return make_tree([(name, time, depth, None) for name, time, depth in nodes])
+
+    tree = CompactLogTree(*nodes[0][:2])
+    stack = [0]
+    for name, time, depth in nodes[1:]:
+        del stack[depth:]
+        stack.append(tree.add_node(stack[-1], name, time))
+    tree.cache_useful_data()
+    return tree
+
+
+def parse_log_parallel(log_file, configuration, jobs, compact=False, min_time=0.0, chunk_bytes=LOG_CHUNK_BYTES):
+    """Parses an Unreal log with jobs worker processes, each working on whole actions.
+    Returns the same (map, headers, codegen, links) a LogParser would produce, in the same order."""
+    with instrumentation.phase("find_actions"):
+        offsets = find_action_offsets(log_file, LOG_CONFIGURATIONS[configuration][0])
+    size = os.path.getsize(log_file)
+
+    # Keep a few chunks per worker around so a single large chunk doesn't leave the other workers idle.
+    chunk_bytes = max(1, min(chunk_bytes, size // (jobs * 4)))
+    chunks = make_log_chunks(offsets, size, chunk_bytes)
+    print("Parsing {} actions in {} chunks with {} workers".format(len(offsets), len(chunks), jobs))
+
+    map = {}
+    headers = {}
+    codegen = {}
+    link_passes = {}
+    # Unpickled trees are never garbage, but every node triggers generation checks that end up
+    # rescanning everything received so far. Collecting once at the end is much cheaper.
+    gc.disable()
+    try:
+        with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+            results = pool.imap(parse_log_chunk, [(log_file, configuration, compact, min_time, start, end) for start, end in chunks])
+            for index, (chunk_map, chunk_headers, chunk_codegen, chunk_link_passes, line_count, char_count, node_count) in enumerate(results):
+                print("{}/{}".format(index + 1, len(chunks)), end="\r")
+                map.update(chunk_map)
+                codegen.update(chunk_codegen)
+                for binary, passes in chunk_link_passes:
+                    if binary in link_passes:
+                        link_passes[binary].merge(passes)
+                    else:
+                        link_passes[binary] = passes
+                instrumentation.count("lines", line_count)
+                instrumentation.count("chars", char_count)
+                instrumentation.count("nodes", node_count)
+                for name, count in chunk_headers.items():
+                    headers[name] = headers.get(name, 0) + count
+    finally:
+        gc.enable()
+
+    links = {binary: make_link_tree(passes.get_nodes(binary), compact) for binary, passes in link_passes.items()}
+    return map, headers, codegen, links
+
+
+def make_header_index(map):
+    """Returns a HeaderIndex of the include trees of every parsed file."""
+    header_index = HeaderIndex()
+    for cpp in map:
+        tree = map[cpp][0]
+        if tree is not None:
+            header_index.add_tree(tree)
+    return header_index
+
+
+def write_results_database(path, map):
+    """Writes the trees of every parsed file to a new ResultsDatabase at path."""
+    with ResultsDatabase(path) as database:
+        for cpp, trees in map.items():
+            database.add_translation_unit(cpp, *trees)
+
+
+def write_shard(path, map, source):
+    """Writes the trees of every parsed file to a new shard at path, to be merged with other parts of the build."""
+    with ShardWriter(path, source) as writer:
+        for cpp, trees in map.items():
+            writer.add_translation_unit(cpp, *trees)
+
+
+def write_trace(path, map, max_bytes=TRACE_FILE_BYTES):
+    """Writes the trees of every parsed file as trace events at path. Returns the paths of the files written."""
+    with TraceWriter(path, max_bytes) as writer:
+        for cpp, trees in map.items():
+            writer.add_translation_unit(cpp, *trees)
+    return writer.paths
+
+
+def parse_arguments():
+    """Parses command line arguments. A missing log file is asked for later."""
+    parser = argparse.ArgumentParser(description="Converts the timing output of an Unreal, MSVC or Qt build log into WizTree .csv files.")
+    parser.add_argument("log_file", nargs="?", help="build log to parse, - reads it from stdin")
+    parser.add_argument("dest_files", nargs="?", default="result", help="prefix of the .csv files (default: result)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes parsing an Unreal log, 0 uses every core (default: 1)")
+    parser.add_argument("--compact", action="store_true",
+                        help="store trees as flat arrays instead of one object per node, needs much less memory on large builds")
+    parser.add_argument("--gzip", action="store_true",
+                        help="write gzip compressed .csv.gz files")
+    parser.add_argument("--min-time", type=float, default=0.0, metavar="SECONDS",
+                        help="collapse the nodes shorter than this into a single \"other (N items)\" node per parent, totals are unchanged")
+    parser.add_argument("--top", type=int, default=0, metavar="K",
+                        help="print the K slowest headers, classes and functions of the build")
+    parser.add_argument("--db", metavar="PATH",
+                        help="also write every parsed node to an SQLite database at PATH, replacing it")
+    parser.add_argument("--shard", metavar="PATH",
+                        help="also write the parsed files to a shard at PATH, that shards.py can merge with other parts of the build")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="also write a trace event file at PATH, one timeline per file, for chrome://tracing or Perfetto")
+    parser.add_argument("--trace-split", type=float, default=TRACE_FILE_BYTES / (1024 * 1024), metavar="MB",
+                        help="start a new trace file once the current one is this big (default: 256)")
+    instrumentation.add_arguments(parser)
+    return parser.parse_args()
+
+
+def run(arguments):
+    if arguments.log_file is None:
+        import tkinter as tk
+        from tkinter import filedialog
+
+        root = tk.Tk()
+        root.withdraw()
+
+        log_file = filedialog.askopenfilename(title="Select log file")
+    else:
+        log_file = arguments.log_file
 
-        print_debug("    Parsing functions...")
-        functions_tree = parse_section(current_file)
-        print_debug("    Functions parsed!")
+    dest_files = arguments.dest_files
+    jobs = arguments.jobs if arguments.jobs > 0 else os.cpu_count() or 1
 
-        parse_beginstring("time(")
-        parse_beginstring("Elapsed Time before Code Generation:")
-
-        if try_parse_string("Code Generation Summary"):
-            parse_int("Total Function Count:")
-            parse_seconds("Elapsed Time:")
-            parse_seconds("Total Compilation Time:")
-            parse_seconds("Average time per function:")
-            for _ in range(try_parse_int("Anomalistic Compile Times:")):
-                get_line()
-            try_parse_int("Serialized Initializer Count:")
-            try_parse_seconds("Serialized Initializer Time:")
-            parse_empty()
-
-        if try_parse_string("RdrReadProc Caching Stats"):
-            parse_int("Functions Cached:")
-            parse_int("Retrieved Count:")
-            parse_int("Abandoned Retrieval Count:")
-            parse_int("Abandoned Caching Count:")
-            parse_int("Wasted Caching Attempts:")
-            parse_int("Functions Retrieved at Least Once:")
-            parse_int("Functions Cached and Never Retrieved:")
-            parse_string("Most Hits:")
-            while not try_parse_empty():
-                get_line()
-            parse_string("Least Hits:")
-            while not try_parse_empty():
-                get_line()
-
-        parse_beginstring("Elapsed Time after Code Generation:")
-        parse_beginstring("time(")
-
-        map[current_file] = includes_tree, classes_tree, functions_tree
+    if log_file == "-":
+        sys.stdin.reconfigure(encoding="utf-8-sig")
+        file = sys.stdin
+    else:
+        file = open_text(log_file)
 
-        print_debug("")
+    try:
+        reader = LineReader(file)
+        configuration = detect_configuration(reader.peek())
+
+        print("{} log file detected".format(configuration))
+
+        with instrumentation.phase("parse"):
+            if jobs > 1 and configuration == "Unreal" and file is not sys.stdin and not get_compression(log_file):
+                map, headers, codegen, links = parse_log_parallel(log_file, configuration, jobs, arguments.compact, arguments.min_time)
+            else:
+                if jobs > 1:
+                    print("Only uncompressed Unreal log files can be split into actions, parsing on a single core")
+
+                parser = LogParser(reader, configuration, compact=arguments.compact, min_time=arguments.min_time)
+                parser.parse()
+                map, headers, codegen, links = parser.map, parser.headers, parser.codegen, parser.links
+                instrumentation.count("lines", reader.line_count)
+                # Decoded characters, as compressed logs and stdin have no meaningful size in bytes.
+                instrumentation.count("chars", reader.char_count)
+                instrumentation.count("nodes", parser.node_count)
+        instrumentation.count("files", len(map))
+    finally:
+        if file is not sys.stdin:
+            file.close()
 
-print("Done!\n\n\n")
+    print("Done!\n\n\n")
 
-if query_yes_no("Write wiztree files?"):
-    for name, index in (("includes", 0), ("classes", 1), ("functions", 2)):
-        print("Writing " + name)
-        with open("{}_{}.csv".format(dest_files, name), "w") as file:
-            file.write("File Name,Size,Allocated,Modified,Attributes,Files,Folders)\n")
+    if arguments.top:
+        report = HotspotReport(dict.fromkeys(CATEGORIES + ((LINK_CATEGORY,) if links else ()), arguments.top))
+        for cpp, trees in map.items():
+            report.add_record(LogRecord(cpp, *trees))
+        for binary, tree in links.items():
+            report.add_tree(LINK_CATEGORY, binary, tree)
+        print("Slowest nodes of the build:")
+        print_hotspots(report.get_results())
+        print("\n\n")
+
+    if arguments.db:
+        print("Writing results database")
+        with instrumentation.phase("export"):
+            write_results_database(arguments.db, map)
+        print("Done!\n\n\n")
+
+    if arguments.shard:
+        print("Writing shard")
+        with instrumentation.phase("export"):
+            write_shard(arguments.shard, map, log_file)
+        print("Done!\n\n\n")
+
+    if arguments.trace:
+        print("Writing trace")
+        with instrumentation.phase("export"):
+            trace_paths = write_trace(arguments.trace, map, int(arguments.trace_split * 1024 * 1024))
+        print("Wrote {}\n\n\n".format(", ".join(trace_paths)))
+
+    if query_yes_no("Write wiztree files?"):
+        print("Writing wiztree files")
+        names = ("includes", "classes", "functions")
+        paths = {name: "{}_{}.csv".format(dest_files, name) for name in names + ((LINK_CATEGORY,) if links else ())}
+        with instrumentation.phase("write"), \
+                WizTreeWriter(paths, "File Name,Size,Allocated,Modified,Attributes,Files,Folders)\n", arguments.gzip) as writer:
             num = 0
             for cpp in map:
                 num += 1
                 print("{}/{}".format(num, len(map)), end="\r")
-                tree = map[cpp][index]
-                if tree is not None:
+                for name, tree in zip(names, map[cpp]):
+                    if tree is not None:
+                        with instrumentation.phase("aggregate"):
+                            tree.compute_num_children()
+                        writer.write_rows(name, tree.get_wiztree_rows())
+            for binary, tree in links.items():
+                with instrumentation.phase("aggregate"):
                     tree.compute_num_children()
-                    tree.to_wiztree(file)
+                writer.write_rows(LINK_CATEGORY, tree.get_wiztree_rows(get_wiztree_parent(binary)))
+        instrumentation.count("output_bytes", sum(os.path.getsize(path) for path in writer.paths.values()))
 
-    print("Done!\n\n\n")
+        print("Done!\n\n\n")
 
-if query_yes_no("Print header usage?"):
-    print("Header usage:")
-    for key, value in sorted(headers.items(), key=operator.itemgetter(1)):
-        print("{}: {}".format(key, value))
+    if links and query_yes_no("Print link times?"):
+        print("Link times:")
+        print_link_times(links)
 
-if query_yes_no("Print cumulative include times?"):
-    headers_cost = {}
+    if codegen and query_yes_no("Print frontend and backend times?"):
+        print("Frontend and backend times:")
+        print_codegen_report(codegen)
 
-    def iterate_includes_tree(tree):
-        if tree.name not in headers_cost:
-            headers_cost[tree.name] = 0
-        headers_cost[tree.name] += tree.time
+    if query_yes_no("Print header usage?"):
+        print("Header usage:")
+        for key, value in sorted(headers.items(), key=operator.itemgetter(1)):
+            print("{}: {}".format(key, value))
 
-        for child in tree.children:
-            iterate_includes_tree(child)
+    header_index = None
+    if query_yes_no("Print cumulative include times?"):
+        with instrumentation.phase("header_index"):
+            header_index = make_header_index(map)
+        for cost in sorted(header_index.get_header_costs(), key=operator.attrgetter("inclusive_time")):
+            print("{}: included {} times in {} files, total time: {}s, exclusive time: {}s".format(
+                cost.path.ljust(50), str(cost.include_count).ljust(4), str(cost.tu_count).ljust(4), cost.inclusive_time, cost.exclusive_time))
 
-    for cpp in map:
-        tree = map[cpp][0]
-        if tree is not None:
-          iterate_includes_tree(tree)
+    if query_yes_no("Print precompiled header candidates?"):
+        if header_index is None:
+            with instrumentation.phase("header_index"):
+                header_index = make_header_index(map)
+
+        print("Precompiled header candidates:")
+        for cost in header_index.get_pch_candidates():
+            print("{}: saves ~{:.3f}s, included in {} files, total time: {}s".format(
+                cost.path.ljust(50), cost.pch_savings, str(cost.tu_count).ljust(4), cost.inclusive_time))
+
+
+def main():
+    arguments = parse_arguments()
+    with Instrumentation(arguments.profile, arguments.trace_memory) as run_instrumentation:
+        run(arguments)
+    if arguments.stats:
+        run_instrumentation.write_summary(arguments.stats)
 
-    sorted_headers_cost = sorted(headers_cost.items(), key=operator.itemgetter(1))
 
-    for name, time in sorted_headers_cost:
-        print("{}: included {} times, total time: {}s".format(name.ljust(50), str(headers[name] if name in headers else 1).ljust(4), time))
+if __name__ == "__main__":
+    main()
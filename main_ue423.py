@@ -1,6 +1,31 @@
+import argparse
+import gc
+import hashlib
+import io
+import multiprocessing
 import os
-import sys
-from tkinter import Tk, filedialog
+import pickle
+import sqlite3
+import time
+
+import instrumentation
+from compression import DECOMPRESSION_ERRORS, is_tar_archive, iter_tar_members, open_text, strip_compression
+from instrumentation import Instrumentation
+from results_db import ResultsDatabase
+from scanner import DirectoryFilter, FileScanner
+from shards import ShardWriter
+from symbols import SYMBOLS
+from timing_tree import CompactTree, OtherBuckets, aggregate_tree, flatten_tree, is_other_name
+from trace_export import TRACE_FILE_BYTES, TraceWriter
+from wiztree import WIZTREE_ROW, WizTreeWriter
+
+# Worker processes receive timing files in batches of roughly this many bytes,
+# so that thousands of small files don't each pay for a round trip to the pool.
+TIMING_FILE_BATCH_BYTES = 1024 * 1024
+
+# Bump whenever the pickled layout of TimingFile or the tree classes changes, this drops every cached entry.
+TIMING_FILE_CACHE_VERSION = 3
+
 
 class TreeNode:
 	""" Base tree node, not very useful on its own. """
@@ -49,27 +74,41 @@ class TreeNode:
 		return sum( 1 for node in self.children if node.self_child_count )
 
 	def _child_count(self):
-		return self.self_child_count + sum( node._child_count() for node in self.children )
+		return len(flatten_tree(self)[0]) - 1
+
+	def _cache_aggregates(self, aggregates, index):
+		""" Caches useful data from the aggregate_tree results of the whole tree. """
+		self.self_leaf_child_count = aggregates.self_leaf_child_count[index]
+		self.child_count = aggregates.child_count[index]
 
 
 class GenericTreeNode(TreeNode):
 	""" Tree node that can work with all three timing data types ( headers, classes, functions ). """
-	def __init__(self, parent=None, data="", duration=0.0):
+	def __init__(self, parent=None, data="", duration=0.0, path=None):
 		super().__init__(parent)
 		self.data = data
 
+		# Full path of a header whose data is its file name, None for other nodes.
+		self.path = path
+
 		# This duration also includes every child.
 		self.duration = duration
 		
 		# Cached. Excludes children. 
 		self.self_duration = -1.0
 
-		# Cached. Tree made out of 'data' separated by \
-		self.tree_path = ""
+	@property
+	def tree_path(self):
+		""" Tree made out of 'data' separated by \, computed on demand instead of being stored. """
+		names = []
+		node = self
+		while node:
+			names.append(node.data)
+			node = node.parent
+		return "\\".join(reversed(names))
 
 	def cache_useful_data(self):
 		super().cache_useful_data()
-		self.tree_path = self._tree_path()
 
 		if self.is_root():
 			self.self_duration = 0.0
@@ -84,14 +123,18 @@ class GenericTreeNode(TreeNode):
 		else:
 			return "root"
 
-	def _self_duration(self):
-		return self.duration - sum( node.duration for node in self.children )
+	def _cache_aggregates(self, aggregates, index):
+		super()._cache_aggregates(aggregates, index)
 
-	def _tree_path(self):
 		if self.is_root():
-			return self.data
+			self.self_duration = 0.0
+			self.duration = aggregates.children_duration[index]
+
 		else:
-			return self.parent.tree_path + "\\" + self.data
+			self.self_duration = aggregates.self_duration[index]
+
+	def _self_duration(self):
+		return self.duration - sum( node.duration for node in self.children )
 
 class Tree:
 	def __init__(self, root=TreeNode()):
@@ -110,24 +153,165 @@ class Tree:
 				node_stack.append((child,indent + 1))
 
 	def cache_useful_data(self):
-		""" Runs cache_useful_data on every node in the tree. """
-		for node, depth in self.get_nodes_po():
-			node.cache_useful_data()
+		""" Caches useful data of every node in the tree with a single aggregate_tree pass. """
+		nodes, parents = flatten_tree(self.root)
+		aggregates = aggregate_tree(parents, [getattr(node, "duration", 0.0) for node in nodes])
+
+		for index, node in enumerate(nodes):
+			node._cache_aggregates(aggregates, index)
 
 	def print(self):
 		for node, indent in self.get_nodes_po():
 			print("{}{}".format("\t" * indent, node.to_string()))
 
+	def to_nodes(self):
+		""" Returns the data and cached data of every GenericTreeNode using pre order, make_tree or make_compact_tree turn it back into a tree. """
+		return [(node.data, node.duration, node.self_duration, node.child_count, node.self_leaf_child_count, depth, node.path)
+			for node, depth in self.get_nodes_po()]
+
+	def __reduce__(self):
+		# Pickling the linked nodes one by one is slower than parsing the timing file again,
+		# so trees are sent to worker processes as flat pre order lists.
+		return make_tree, (self.to_nodes(),)
+
+
+def make_tree(nodes):
+	""" Rebuilds a Tree of GenericTreeNode, cached data included, from the pre order list made by Tree.to_nodes. """
+
+	tree = None
+	node_stack = []
+	for data, duration, self_duration, child_count, self_leaf_child_count, depth, path in nodes:
+		while node_stack and node_stack[-1][1] >= depth:
+			node_stack.pop()
+
+		parent_node = node_stack[-1][0] if node_stack else None
+		node = GenericTreeNode(parent_node, data, duration, path)
+		node.self_duration = self_duration
+		node.child_count = child_count
+		node.self_leaf_child_count = self_leaf_child_count
+
+		if parent_node:
+			parent_node.add_child(node)
+		else:
+			tree = Tree(node)
+
+		node_stack.append((node, depth))
+
+	return tree
+
+def make_compact_tree(nodes):
+	""" Rebuilds a CompactTree from the pre order list made by Tree.to_nodes or CompactTree.to_nodes. """
+
+	tree = CompactTree(nodes[0][0], nodes[0][1])
+	node_stack = [(0, nodes[0][5])]
+	for data, duration, self_duration, child_count, self_leaf_child_count, depth, path in nodes[1:]:
+		while node_stack[-1][1] >= depth:
+			node_stack.pop()
+
+		node_stack.append((tree.add_node(node_stack[-1][0], data, duration, path), depth))
+
+	cache_compact_tree(tree)
+	return tree
 
 class TimingFile:
 	""" Respresets single .cpp.timing.txt file """
-	def __init__(self,path,headers, classes, functions):
-		self.name = os.path.basename(path)
+	def __init__(self,path,headers, classes, functions, line_count=0):
+		self.name = os.path.basename(strip_compression(path))
 		self.path = path
 		self.headers = headers
 		self.classes = classes
 		self.functions = functions
 
+		# Lines parsed to make this instance, 0 if it was loaded from a cache.
+		self.line_count = line_count
+
+	def get_node_count(self):
+		""" Number of nodes of all three trees, roots included. """
+		return sum( len(tree) if isinstance(tree, CompactTree) else tree.root.child_count + 1
+			for tree in (self.headers, self.classes, self.functions) )
+
+class TimingFileCache:
+	""" On disk cache of parsed TimingFile objects, keyed by path, size, modification time and minimum node time.
+	With use_hash a file whose size or time changed but whose content hash did not is still a hit.
+	Least recently used entries are evicted once the cache holds more than max_bytes of data. """
+	def __init__(self, path, max_bytes=1024 * 1024 * 1024, use_hash=False):
+		self.max_bytes = max_bytes
+		self.use_hash = use_hash
+		self.connection = sqlite3.connect(path)
+
+		version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+		if version != TIMING_FILE_CACHE_VERSION:
+			self.connection.execute("DROP TABLE IF EXISTS timing_files")
+			self.connection.execute("PRAGMA user_version = {}".format(TIMING_FILE_CACHE_VERSION))
+
+		self.connection.execute("CREATE TABLE IF NOT EXISTS timing_files ("
+			"path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, min_time REAL, last_used REAL, data BLOB)")
+		self.connection.execute("CREATE INDEX IF NOT EXISTS timing_files_last_used ON timing_files (last_used)")
+		self.connection.commit()
+
+	def close(self):
+		""" Saves pending changes and closes the database. """
+		self.commit()
+		self.connection.close()
+
+	def get(self, path, compact=False, min_time=0.0):
+		""" Returns the cached TimingFile for path parsed with min_time, or None if it's missing or out of date. """
+
+		try:
+			stat = os.stat(path)
+		except OSError:
+			return None
+
+		row = self.connection.execute("SELECT size, mtime, hash, min_time, data FROM timing_files WHERE path = ?", (path,)).fetchone()
+		if not row or row[3] != min_time:
+			return None
+
+		size, mtime, content_hash, _, data = row
+		if size != stat.st_size or mtime != stat.st_mtime_ns:
+			if not self.use_hash or not content_hash or content_hash != self._hash(path):
+				return None
+
+		self.connection.execute("UPDATE timing_files SET size = ?, mtime = ?, last_used = ? WHERE path = ?",
+			(stat.st_size, stat.st_mtime_ns, time.time(), path))
+
+		# Entries only hold built-in types, so they load no matter which module the classes live in.
+		headers, classes, functions = pickle.loads(data)
+		make = make_compact_tree if compact else make_tree
+		return TimingFile(path, make(headers), make(classes), make(functions))
+
+	def put(self, path, timing_file, min_time=0.0):
+		""" Stores timing_file as the content of path parsed with min_time. """
+
+		try:
+			stat = os.stat(path)
+		except OSError:
+			return
+
+		content_hash = self._hash(path) if self.use_hash else None
+		data = (timing_file.headers.to_nodes(), timing_file.classes.to_nodes(), timing_file.functions.to_nodes())
+		self.connection.execute("INSERT OR REPLACE INTO timing_files VALUES (?, ?, ?, ?, ?, ?, ?)",
+			(path, stat.st_size, stat.st_mtime_ns, content_hash, min_time, time.time(), pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+
+	def commit(self):
+		""" Evicts entries above the size cap and saves every change made so far. """
+
+		total_bytes = self.connection.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM timing_files").fetchone()[0]
+		if total_bytes > self.max_bytes:
+			evicted_paths = []
+			for path, size in self.connection.execute("SELECT path, LENGTH(data) FROM timing_files ORDER BY last_used"):
+				if total_bytes <= self.max_bytes:
+					break
+				evicted_paths.append((path,))
+				total_bytes -= size
+
+			self.connection.executemany("DELETE FROM timing_files WHERE path = ?", evicted_paths)
+
+		self.connection.commit()
+
+	def _hash(self, path):
+		with open(path, "rb") as file:
+			return hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
 def print_progress_bar(iteration, total, prefix='', suffix='', decimals=1, length=60, fill='█'):
     """
 	Taken from https://stackoverflow.com/questions/3173320/text-progress-bar-in-the-console
@@ -149,38 +333,80 @@ def print_progress_bar(iteration, total, prefix='', suffix='', decimals=1, lengt
     if iteration == total: 
         print()
 
-def get_argv_path_or_ask_user(argument_index):
-	""" Tries to get a path from sys.argv and if that fails asks the user directly. """
-	if len(sys.argv) <= argument_index:
+def parse_arguments():
+	""" Parses command line arguments. Paths that are not provided are asked for later. """
+	parser = argparse.ArgumentParser(description="Converts .cpp.timing.txt files into WizTree .csv files.")
+	parser.add_argument("search_path", nargs="?", help="directory searched for .cpp.timing.txt files")
+	parser.add_argument("output_path", nargs="?", help="directory the .csv files are written to")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+		help="number of worker processes reading timing files, 0 uses every core (default: 1)")
+	parser.add_argument("--compact", action="store_true",
+		help="store trees as flat arrays instead of one object per node, needs much less memory on large builds")
+	parser.add_argument("--gzip", action="store_true",
+		help="write gzip compressed .csv.gz files")
+	parser.add_argument("--min-time", type=float, default=0.0, metavar="SECONDS",
+		help="collapse the nodes shorter than this into a single \"other (N items)\" node per parent, totals are unchanged")
+	parser.add_argument("--cache", metavar="PATH",
+		help="database of parsed timing files, only new or changed files are parsed again")
+	parser.add_argument("--cache-size", type=int, default=1024, metavar="MB",
+		help="least recently used entries are evicted above this size (default: 1024)")
+	parser.add_argument("--cache-hash", action="store_true",
+		help="also reuse entries of files whose size or time changed but whose content didn't")
+	parser.add_argument("--db", metavar="PATH",
+		help="also write every parsed node to an SQLite database at PATH, replacing it")
+	parser.add_argument("--platform", action="append", metavar="NAME",
+		help="only search the folders of this platform ( e.g. Win64 ), can be repeated")
+	parser.add_argument("--configuration", action="append", metavar="NAME",
+		help="only search the folders of this configuration ( e.g. Development ), can be repeated")
+	parser.add_argument("--manifest", metavar="PATH",
+		help="file listing the folders searched, so that only folders that changed are listed again on the next run")
+	parser.add_argument("--shard", metavar="PATH",
+		help="also write the timing files to a shard at PATH, that shards.py can merge with other parts of the build")
+	parser.add_argument("--trace", metavar="PATH",
+		help="also write a trace event file at PATH, one timeline per file, for chrome://tracing or Perfetto")
+	parser.add_argument("--trace-split", type=float, default=TRACE_FILE_BYTES / (1024 * 1024), metavar="MB",
+		help="start a new trace file once the current one is this big (default: 256)")
+	instrumentation.add_arguments(parser)
+	return parser.parse_args()
+
+def get_path_or_ask_user(path):
+	""" Returns the given path and if there is none asks the user directly. """
+	if not path:
+		from tkinter import Tk, filedialog
+
 		root = Tk()
 		root.withdraw()
 		path = filedialog.askdirectory()
-	else:
-		path = sys.argv[argument_index]
 
 	if path and os.path.exists(path) and os.path.isdir(path):
 		return path
 
 	return ""
 
-def get_search_path():
-	""" Figures out where to look for timing data. Either uses argv or asks the user. """
-	return get_argv_path_or_ask_user(1)
+def get_search_path(arguments):
+	""" Figures out where to look for timing data, a folder or a tar archive of one. Either uses argv or asks the user. """
+	if arguments.search_path and is_tar_archive(arguments.search_path) and os.path.isfile(arguments.search_path):
+		return arguments.search_path
 
-def get_output_path():
+	return get_path_or_ask_user(arguments.search_path)
+
+def get_output_path(arguments):
 	""" Figures out where to write results. Either uses argv or asks the user. """
-	return get_argv_path_or_ask_user(2)
+	return get_path_or_ask_user(arguments.output_path)
 
-def get_timing_file_paths(path):
-	""" Recursivly searches given path for cpp.timing.txt files. """
+def is_timing_file_name(name):
+	""" Whether name is that of a cpp.timing.txt file, compressed or not. """
+	return strip_compression(name).endswith("cpp.timing.txt")
 
-	paths = []
-	for root, dirs, files in os.walk(path):
-		for file in files:
-			if file.endswith("cpp.timing.txt"):
-				file_path = os.path.join(root, file)
-				paths.append(file_path)
+def get_timing_file_paths(path, directory_filter=None, manifest_path=None):
+	""" Recursivly searches given path for cpp.timing.txt files, including .gz, .bz2 and .xz compressed ones.
+	Folders that can't hold timing files are skipped, along with the platforms and configurations left out by directory_filter.
+	With manifest_path, directories that didn't change since the last search aren't listed again. """
 
+	scanner = FileScanner(is_timing_file_name, directory_filter, manifest_path)
+	paths = scanner.scan(path)
+	instrumentation.count("directories", scanner.scanned_count)
+	instrumentation.count("directories_reused", scanner.reused_count)
 	return paths
 
 def find_section(lines, section_marker):
@@ -208,67 +434,187 @@ def get_indent_level(line):
 
 	return level
 
-def make_section_tree(path, lines, section_marker, make_node):
-	""" Makes a Tree instance for a requested section. """
+def add_other_node(node_stack, others, make_node):
+	""" Adds the children collapsed under the last node of node_stack, if any, as a single node. """
+
+	other = others.pop(len(node_stack) - 1)
+	if other:
+		parent_node = node_stack[-1][0]
+		parent_node.add_child(make_node(None, parent_node, other))
 
-	root_node_data = "W:\\" + os.path.basename(path).rstrip( ".timing.txt")
+def make_section_tree(path, lines, section_marker, make_node, min_time=0.0):
+	""" Makes a Tree instance for a requested section. Nodes shorter than min_time are collapsed, see OtherBuckets. """
+
+	root_node_data = "W:\\" + os.path.basename(strip_compression(path)).rstrip( ".timing.txt")
 	tree = Tree(make_node(root_node_data))
 	
 	node_stack = [(tree.root, 0)]
+	others = OtherBuckets(min_time)
+	# Lines indented deeper than this belong to a collapsed node, None when no node is being skipped.
+	skip_indent = None
 	line_count, first_line_index = find_section(lines,section_marker)
 	for line in lines[first_line_index : first_line_index + line_count]:
 		parent_node, parent_indent = node_stack[-1]
 
-		child_indent = get_indent_level(line)
+		child_indent, data, duration = parse_tree_line(line)
+		if skip_indent is not None:
+			if child_indent > skip_indent:
+				continue
+			skip_indent = None
 
 		while child_indent <= parent_indent:
 			if len(node_stack) > 0:
+				if others.buckets:
+					add_other_node(node_stack, others, make_node)
 				node_stack.pop()
 				parent_node, parent_indent = node_stack[-1]
 			else:
 				raise RuntimeError("Malformed section tree, section: {}".format(section_marker))
 
-		child_node = make_node(line, parent_node)
+		if duration < min_time:
+			others.add(len(node_stack) - 1, duration)
+			skip_indent = child_indent
+			continue
+
+		child_node = make_node(line, parent_node, (data, duration))
 
 		parent_node.add_child(child_node)
 		node_stack.append((child_node, child_indent))
 
-	tree.cache_useful_data()
+	while others.buckets:
+		add_other_node(node_stack, others, make_node)
+		node_stack.pop()
+
+	with instrumentation.phase("aggregate"):
+		tree.cache_useful_data()
 	return tree
 
-def make_generic_tree_node(line=None, parent=None):
-	""" Parses data line ( data : timing ) and creates GenericTreeNode. """
+def make_compact_section_tree(path, lines, section_marker, get_name_id=None, min_time=0.0, keep_path=False):
+	""" Makes a CompactTree instance for a requested section. Data is interned in SYMBOLS,
+	get_name_id optionally maps the symbol id of every line's data to the id that is stored.
+	With keep_path, the line's data is also stored as the node's path ( e.g. the full path of a header ).
+	Nodes shorter than min_time are collapsed, see OtherBuckets. """
 
-	if parent:
-		separator_index = line.rfind(":") 
-		if separator_index != -1:
-			data = line[0 : separator_index].strip().rstrip()
-			duration = float(line[separator_index + 1 : -1])
-			return GenericTreeNode(parent, data, duration)
+	root_node_data = "W:\\" + os.path.basename(strip_compression(path)).rstrip( ".timing.txt")
+	tree = CompactTree(root_node_data)
+
+	node_stack = [(0, 0)]
+	others = OtherBuckets(min_time)
+	skip_indent = None
+	line_count, first_line_index = find_section(lines,section_marker)
+	symbol_ids = SYMBOLS.ids
+	for line in lines[first_line_index : first_line_index + line_count]:
+		child_indent, data, duration = parse_tree_line(line)
+		if skip_indent is not None:
+			if child_indent > skip_indent:
+				continue
+			skip_indent = None
+
+		while child_indent <= node_stack[-1][1]:
+			if len(node_stack) > 1:
+				if others.buckets:
+					add_compact_other_node(tree, node_stack, others)
+				node_stack.pop()
+			else:
+				raise RuntimeError("Malformed section tree, section: {}".format(section_marker))
+
+		if duration < min_time:
+			others.add(len(node_stack) - 1, duration)
+			skip_indent = child_indent
+			continue
+
+		name_id = symbol_ids.get(data)
+		if name_id is None:
+			name_id = SYMBOLS.intern(data)
+		path_id = name_id if keep_path else -1
+		if get_name_id:
+			name_id = get_name_id(name_id)
+
+		node_stack.append((tree.add_symbol_node(node_stack[-1][0], name_id, duration, path_id), child_indent))
 
-		raise RuntimeError("Malformed data line, can't find ':': {}".format(line))
+	while others.buckets:
+		add_compact_other_node(tree, node_stack, others)
+		node_stack.pop()
+
+	with instrumentation.phase("aggregate"):
+		cache_compact_tree(tree)
+	return tree
+
+def add_compact_other_node(tree, node_stack, others):
+	""" Adds the children collapsed under the last node of node_stack, if any, as a single node of tree. """
+
+	other = others.pop(len(node_stack) - 1)
+	if other:
+		tree.add_node(node_stack[-1][0], *other)
+
+def cache_compact_tree(tree):
+	""" Runs cache_useful_data on a CompactTree, giving its root the same values a GenericTreeNode root gets. """
+
+	tree.cache_useful_data()
+	tree.duration[0] -= tree.self_duration[0]
+	tree.self_duration[0] = 0.0
+
+def parse_data_line(line):
+	""" Splits data line ( data : timing ) into data and duration. """
+
+	separator_index = line.rfind(":") 
+	if separator_index != -1:
+		data = line[0 : separator_index].strip().rstrip()
+		duration = float(line[separator_index + 1 : -1])
+		return data, duration
+
+	raise RuntimeError("Malformed data line, can't find ':': {}".format(line))
+
+def parse_tree_line(line):
+	""" Returns the indent level, data and duration of a data line. Well formed lines ( data: 0.123s ) are split
+	with a few string methods running in C, anything else goes through the character by character parsers which report errors. """
+
+	data, separator, duration = line.rpartition(": ")
+	if separator and duration[-1:] == "s":
+		stripped = data.lstrip("\t")
+		return len(data) - len(stripped), stripped.strip(), float(duration[:-1])
+
+	data, duration = parse_data_line(line)
+	return get_indent_level(line), data, duration
+
+def make_generic_tree_node(line=None, parent=None, parsed_line=None):
+	""" Parses data line ( data : timing ) and creates GenericTreeNode.
+	parsed_line optionally gives the ( data, duration ) of a line that was already parsed. """
+
+	if parent:
+		data, duration = parsed_line or parse_data_line(line)
+		# Interned so that every node with the same data shares a single string.
+		return GenericTreeNode(parent, SYMBOLS.intern_string(data), duration)
 	else:
 		return GenericTreeNode(None, line, 0.0 )
 
-def make_generic_tree_header_node(line=None, parent=None): 
-	node = make_generic_tree_node(line,parent)
-	if not node.is_root():
-		node.data =  os.path.basename(node.data)
+def make_generic_tree_header_node(line=None, parent=None, parsed_line=None): 
+	""" Same as make_generic_tree_node, keeping the header's full path as path and its file name as data. """
+	node = make_generic_tree_node(line,parent,parsed_line)
+	if not node.is_root() and not is_other_name(node.data):
+		node.path = node.data
+		node.data = SYMBOLS.basename(node.data)
 	return node
 
-def make_timing_file(path,lines):
-	"""  Creates an instance of TimingFile from a given list of lines. Returns None in case of malformed data. """
+def make_timing_file(path,lines,compact=False,min_time=0.0):
+	"""  Creates an instance of TimingFile from a given list of lines. Returns None in case of malformed data.
+	With compact the trees are CompactTree instances instead of Tree instances. Nodes shorter than min_time are collapsed. """
 	try:
-		header_tree = make_section_tree(path,lines, "Include Headers:", make_generic_tree_header_node)
-		class_tree = make_section_tree(path,lines, "Class Definitions:", make_generic_tree_node)
-		function_tree = make_section_tree(path,lines, "Function Definitions:", make_generic_tree_node)
-		return TimingFile(path, header_tree, class_tree, function_tree)
+		if compact:
+			header_tree = make_compact_section_tree(path,lines, "Include Headers:", SYMBOLS.intern_basename, min_time, keep_path=True)
+			class_tree = make_compact_section_tree(path,lines, "Class Definitions:", min_time=min_time)
+			function_tree = make_compact_section_tree(path,lines, "Function Definitions:", min_time=min_time)
+		else:
+			header_tree = make_section_tree(path,lines, "Include Headers:", make_generic_tree_header_node, min_time)
+			class_tree = make_section_tree(path,lines, "Class Definitions:", make_generic_tree_node, min_time)
+			function_tree = make_section_tree(path,lines, "Function Definitions:", make_generic_tree_node, min_time)
+		return TimingFile(path, header_tree, class_tree, function_tree, len(lines))
 
 	except RuntimeError as error:
 		print("Failed to create timing file for {}. {}".format(path, str(error)))
 		return None
 
-def read_timing_file(path):
+def read_timing_file(path, compact=False, min_time=0.0):
 	""" Creates an instance of TimingFile from a given path. """
 
 	if not os.path.exists(path):
@@ -279,77 +625,308 @@ def read_timing_file(path):
 		return None
 	else:
 		try:
-			with open(path, "r", encoding="utf-8") as file:
+			with open_text(path, encoding="utf-8") as file:
 				lines = list(map(lambda line : line.rstrip(), file.readlines()))
-				return make_timing_file(path,lines)
+				return make_timing_file(path,lines,compact,min_time)
 
-		except OSError as error:
+		except DECOMPRESSION_ERRORS as error:
 			print("Can't read timing file, failed to open: {}".format(path))
 
 	return None
 
-def read_timing_files(paths):
-	""" Creates an instance of TimingFile for every path provided. """
+def make_timing_file_from_text(path, text, compact=False, min_time=0.0):
+	""" Creates an instance of TimingFile from the whole content of a timing file. """
+
+	lines = [line.rstrip() for line in io.StringIO(text)]
+	return make_timing_file(path, lines, compact, min_time)
+
+def make_timing_file_text_batch(batch):
+	""" Pool worker, creates an instance of TimingFile ( or None ) for every ( path, text ) pair in the batch. """
+
+	items, compact, min_time = batch
+	return [make_timing_file_from_text(path, text, compact, min_time) for path, text in items]
+
+def iter_archive_timing_file_batches(archive_path, batch_bytes):
+	""" Yields lists of ( path, text ) pairs holding roughly batch_bytes of timing data, for every timing file of a tar archive.
+	Paths are those of the members appended to the archive path. """
+
+	batch = []
+	batch_size = 0
+	for name, text in iter_tar_members(archive_path, is_timing_file_name):
+		batch.append((os.path.join(archive_path, name), text))
+		batch_size += len(text)
+		if batch_size >= batch_bytes:
+			yield batch
+			batch = []
+			batch_size = 0
+
+	if batch:
+		yield batch
+
+def iter_archive_timing_files(archive_path, compact=False, min_time=0.0):
+	""" Yields an instance of TimingFile for every timing file of a tar archive that could be read, reading the archive as they are requested. """
+
+	for name, text in iter_tar_members(archive_path, is_timing_file_name):
+		timing_file = make_timing_file_from_text(os.path.join(archive_path, name), text, compact, min_time)
+		if timing_file:
+			yield timing_file
+
+def read_archive_timing_files(archive_path, jobs=1, batch_bytes=TIMING_FILE_BATCH_BYTES, compact=False, min_time=0.0):
+	""" Creates an instance of TimingFile for every timing file of a tar archive ( .tar, .tar.gz, .tar.bz2 or .tar.xz ).
+	The archive is decompressed as a stream in this process while jobs worker processes ( 0 means every core ) parse the files,
+	nothing is extracted to disk. Files are returned in archive order. """
+
+	if jobs <= 0:
+		jobs = os.cpu_count() or 1
 
 	files = []
-	for index, path in enumerate(paths):
-		print_progress_bar(index + 1, len(paths), "Reading timing files:")
-		file = read_timing_file(path)
+	line_count = 0
+	gc.disable()
+	try:
+		batches = iter_archive_timing_file_batches(archive_path, batch_bytes)
+		if jobs == 1:
+			results = map(make_timing_file_text_batch, ((batch, compact, min_time) for batch in batches))
+			files = [file for batch_files in results for file in batch_files]
+		else:
+			with multiprocessing.Pool(jobs) as pool:
+				for batch_files in pool.imap(make_timing_file_text_batch, ((batch, compact, min_time) for batch in batches)):
+					files.extend(batch_files)
+					print("{} timing files read".format(len(files)), end="\r")
+	except DECOMPRESSION_ERRORS as error:
+		print("Can't read archive {}: {}".format(archive_path, error))
+	finally:
+		gc.enable()
+
+	files = [file for file in files if file]
+	print("{} timing files read from {}".format(len(files), archive_path))
+	instrumentation.count("files", len(files))
+	instrumentation.count("bytes", os.path.getsize(archive_path))
+	instrumentation.count("lines", sum( file.line_count for file in files ))
+	instrumentation.count("nodes", sum( file.get_node_count() for file in files ))
+	return files
+
+def iter_timing_files(paths, compact=False, min_time=0.0):
+	""" Yields an instance of TimingFile for every path provided that could be read, reading files as they are requested. """
+
+	for path in paths:
+		file = read_timing_file(path, compact, min_time)
+		if file:
+			yield file
+
+def read_timing_file_batch(batch):
+	""" Pool worker, creates an instance of TimingFile ( or None ) for every path in the batch. """
+
+	paths, compact, min_time = batch
+	return [read_timing_file(path, compact, min_time) for path in paths]
+
+def make_timing_file_batches(paths, batch_bytes):
+	""" Groups consecutive paths into batches holding roughly batch_bytes of timing data. """
+
+	batches = []
+	batch = []
+	batch_size = 0
+	for path in paths:
+		try:
+			batch_size += os.path.getsize(path)
+		except OSError:
+			pass
+
+		batch.append(path)
+		if batch_size >= batch_bytes:
+			batches.append(batch)
+			batch = []
+			batch_size = 0
+
+	if batch:
+		batches.append(batch)
+
+	return batches
+
+def parse_timing_files(paths, jobs, batch_bytes, compact, min_time=0.0):
+	""" Creates an instance of TimingFile ( or None ) for every path provided, in the same order, using jobs worker processes. """
+
+	if jobs == 1 or len(paths) <= 1:
+		files = []
+		for index, path in enumerate(paths):
+			print_progress_bar(index + 1, len(paths), "Reading timing files:")
+			files.append(read_timing_file(path, compact, min_time))
+
+		return files
+
+	# Keep a few batches per worker around so a single large batch doesn't leave the other workers idle.
+	total_bytes = sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+	batch_bytes = max(1, min(batch_bytes, total_bytes // (jobs * 4)))
+	batches = make_timing_file_batches(paths, batch_bytes)
+
+	files = []
+	with multiprocessing.Pool(min(jobs, len(batches))) as pool:
+		# imap yields batches in submission order, which keeps the output deterministic.
+		for batch_files in pool.imap(read_timing_file_batch, [(batch, compact, min_time) for batch in batches]):
+			files.extend(batch_files)
+			print_progress_bar(len(files), len(paths), "Reading timing files:")
+
+	return files
+
+def read_timing_files(paths, jobs=1, batch_bytes=TIMING_FILE_BATCH_BYTES, cache=None, compact=False, min_time=0.0):
+	""" Creates an instance of TimingFile for every path provided, using jobs worker processes ( 0 means every core ).
+	Files are returned in the same order as paths no matter how many workers are used.
+	With a TimingFileCache only new or changed files are parsed. With compact trees are stored in CompactTree instances.
+	Nodes shorter than min_time seconds are collapsed into an "other" node per parent. """
+
+	if jobs <= 0:
+		jobs = os.cpu_count() or 1
+
+	# Every node is long lived, yet allocating them triggers generation checks that end up
+	# rescanning every tree built so far. Collecting once at the end is much cheaper.
+	gc.disable()
+	try:
+		cached_files = {}
+		if cache:
+			with instrumentation.phase("cache_lookup"):
+				for path in paths:
+					file = cache.get(path, compact, min_time)
+					if file:
+						cached_files[path] = file
+
+			print("{} of {} timing files found in cache".format(len(cached_files), len(paths)))
+			instrumentation.count("cache_hits", len(cached_files))
+
+		parsed_paths = [path for path in paths if path not in cached_files]
+		with instrumentation.phase("parse"):
+			parsed_files = parse_timing_files(parsed_paths, jobs, batch_bytes, compact, min_time)
+		if cache:
+			with instrumentation.phase("cache_store"):
+				for path, file in zip(parsed_paths, parsed_files):
+					if file:
+						cache.put(path, file, min_time)
+
+				cache.commit()
+	finally:
+		gc.enable()
+
+	parsed_files = dict(zip(parsed_paths, parsed_files))
+	files = []
+	for path in paths:
+		file = cached_files[path] if path in cached_files else parsed_files[path]
 		if file:
 			files.append(file)
 
+	instrumentation.count("files", len(files))
+	instrumentation.count("bytes", sum( os.path.getsize(file.path) for file in parsed_files.values() if file ))
+	instrumentation.count("lines", sum( file.line_count for file in files ))
+	instrumentation.count("nodes", sum( file.get_node_count() for file in files ))
 	return files
 
-def write_wiztree_file(timing_files, get_tree, output_path, debug_prefix=""):
-	""" Writes .csv file for a single Tree object. """
+def get_wiztree_rows(tree):
+	""" Returns .csv rows for a single Tree object. """
 
-	with open(output_path, "w", encoding="utf-8") as wiztree_file:
-		wiztree_file.write("File Name,Size,Allocated,Modified,Attributes,Files,Folders\n")
+	rows = []
+	tree_paths = []
+	for node, depth in tree.get_nodes_po():
+		# Paths are built from the parent's path on the way down instead of being stored on every node.
+		del tree_paths[depth:]
+		tree_path = tree_paths[-1] + "\\" + node.data if tree_paths else node.data
+		tree_paths.append(tree_path)
 
-		for index, timing_file in enumerate(timing_files):
-			for node, depth in get_tree(timing_file).get_nodes_po():
-				if not node.is_leaf():
-					file_name = '"' + node.tree_path + '\\"'
-				else:
-					file_name = '"' + node.tree_path + '"'
-					
-				# Note about 1024 * 1000. 
-				# We want to convert 1s to 1MB in WizTree but both
-				# 1000 * 1000 and 1024 * 1024 give bad results ( too small or too big ).
-				# Only with 1024 * 1000 0.93s gets displayed as 0.93MB.
+		# Note about 1024 * 1000. 
+		# We want to convert 1s to 1MB in WizTree but both
+		# 1000 * 1000 and 1024 * 1024 give bad results ( too small or too big ).
+		# Only with 1024 * 1000 0.93s gets displayed as 0.93MB.
+
+		if depth == 0:
+			size = int( node.duration * 1024 * 1000 )
+		else:
+			size = int( node.self_duration * 1024 * 1000 )
 
-				if node.is_root():
-					size = int( node.duration * 1024 * 1000 )
-				else:
-					size = int( node.self_duration * 1024 * 1000 )
+		files = node.self_leaf_child_count
+		folders = node.self_child_count - files
 
-				allocated = size
-				modified = r"2019/01/01 00:00:00"
-				attributes = "0"
-				files = node.self_leaf_child_count
-				folders = node.self_child_count - files
+		if node.self_child_count > 0:
+			rows.append(WIZTREE_ROW % (tree_path + "\\", size, size, files, folders))
+			if depth > 0:
+				rows.append(WIZTREE_ROW % (tree_path + "\\self", size, size, files, folders))
+		else:
+			rows.append(WIZTREE_ROW % (tree_path, size, size, files, folders))
+
+	return rows
 
-				wiztree_file.write( "{},{},{},{},{},{},{}\n".format( file_name, size, allocated, modified, attributes, files, folders ) )
+def write_wiztree_files(timing_files, output_path, compress=False):
+	""" Writes .csv files for all three types of data in a single pass over the timing files. """
 
-				if not node.is_leaf() and not node.is_root():
-					file_name = '"' + node.tree_path + "\\self" + '"' 
-					wiztree_file.write( "{},{},{},{},{},{},{}\n".format( file_name, size, allocated, modified, attributes, files, folders ) )
+	paths = {
+		"includes": os.path.join(output_path, "wiztree_includes.csv"),
+		"classes": os.path.join(output_path, "wiztree_classes.csv"),
+		"functions": os.path.join(output_path, "wiztree_functions.csv"),
+	}
 
-			print_progress_bar(index+1, len(timing_files), debug_prefix)
+	with WizTreeWriter(paths, "File Name,Size,Allocated,Modified,Attributes,Files,Folders\n", compress, "utf-8") as writer:
+		for index, timing_file in enumerate(timing_files):
+			writer.write_rows("includes", get_wiztree_rows(timing_file.headers))
+			writer.write_rows("classes", get_wiztree_rows(timing_file.classes))
+			writer.write_rows("functions", get_wiztree_rows(timing_file.functions))
+			print_progress_bar(index + 1, len(timing_files), "Writing wiztree files:")
 
+	instrumentation.count("output_bytes", sum( os.path.getsize(path) for path in writer.paths.values() ))
 
+def write_results_database(timing_files, path):
+	""" Writes the trees of every timing file to a new ResultsDatabase at path. """
 
-def write_wiztree_files(timing_files, output_path):
-	""" Writes .csv files for all three types of data. """
+	with ResultsDatabase(path) as database:
+		for timing_file in timing_files:
+			database.add_translation_unit(timing_file.path, timing_file.headers, timing_file.classes, timing_file.functions)
 
-	write_wiztree_file(timing_files, lambda f : f.headers, os.path.join(output_path, "wiztree_includes.csv"), "Writing wiztree includes:")
-	write_wiztree_file(timing_files, lambda f : f.classes, os.path.join(output_path, "wiztree_classes.csv"), "Writing wiztree classes:")
-	write_wiztree_file(timing_files, lambda f : f.functions, os.path.join(output_path, "wiztree_functions.csv"), "Writing wiztree functions:")
+def write_shard(timing_files, path, source):
+	""" Writes the trees of every timing file to a new shard at path, to be merged with other parts of the build. """
 
-if __name__ == "__main__":
-	search_path = get_search_path()
-	file_paths = get_timing_file_paths(search_path)
-	timing_files = read_timing_files(file_paths)
+	with ShardWriter(path, source) as writer:
+		for timing_file in timing_files:
+			writer.add_record(timing_file)
 
-	output_path = get_output_path()
-	write_wiztree_files(timing_files,output_path)
+def write_trace(timing_files, path, max_bytes=TRACE_FILE_BYTES):
+	""" Writes the trees of every timing file as trace events at path. Returns the paths of the files written. """
+
+	with TraceWriter(path, max_bytes) as writer:
+		for timing_file in timing_files:
+			writer.add_record(timing_file)
+	return writer.paths
+
+if __name__ == "__main__":
+	arguments = parse_arguments()
+	with Instrumentation(arguments.profile, arguments.trace_memory) as run_instrumentation:
+		search_path = get_search_path(arguments)
+		if is_tar_archive(search_path):
+			if arguments.cache:
+				print("Timing files read from an archive are not cached")
+			with instrumentation.phase("read"):
+				timing_files = read_archive_timing_files(search_path, arguments.jobs, compact=arguments.compact, min_time=arguments.min_time)
+		else:
+			with instrumentation.phase("scan"):
+				directory_filter = DirectoryFilter(arguments.platform, arguments.configuration)
+				file_paths = get_timing_file_paths(search_path, directory_filter, arguments.manifest)
+			cache = None
+			if arguments.cache:
+				cache = TimingFileCache(arguments.cache, arguments.cache_size * 1024 * 1024, arguments.cache_hash)
+
+			with instrumentation.phase("read"):
+				timing_files = read_timing_files(file_paths, arguments.jobs, cache=cache, compact=arguments.compact, min_time=arguments.min_time)
+			if cache:
+				cache.close()
+
+		if arguments.db:
+			with instrumentation.phase("export"):
+				write_results_database(timing_files, arguments.db)
+
+		if arguments.shard:
+			with instrumentation.phase("export"):
+				write_shard(timing_files, arguments.shard, search_path)
+
+		if arguments.trace:
+			with instrumentation.phase("export"):
+				write_trace(timing_files, arguments.trace, int(arguments.trace_split * 1024 * 1024))
+
+		output_path = get_output_path(arguments)
+		with instrumentation.phase("write"):
+			write_wiztree_files(timing_files, output_path, arguments.gzip)
+
+	if arguments.stats:
+		run_instrumentation.write_summary(arguments.stats)
@@ -0,0 +1,224 @@
+import itertools
+import operator
+import os
+import sqlite3
+
+from timing_tree import CompactTree, aggregate_tree, flatten_tree
+
+# Rows are inserted with executemany and committed once this many are pending.
+RESULTS_DB_BATCH_ROWS = 100000
+
+RESULTS_DB_SCHEMA = """
+CREATE TABLE translation_units (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    -- Totals of every category, NULL if the file has no data for it.
+    includes_time REAL,
+    classes_time REAL,
+    functions_time REAL
+);
+CREATE TABLE includes (
+    id INTEGER PRIMARY KEY,
+    tu_id INTEGER NOT NULL REFERENCES translation_units(id),
+    parent_id INTEGER REFERENCES includes(id),
+    depth INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT,
+    inclusive_time REAL NOT NULL,
+    self_time REAL NOT NULL
+);
+CREATE TABLE classes (
+    id INTEGER PRIMARY KEY,
+    tu_id INTEGER NOT NULL REFERENCES translation_units(id),
+    parent_id INTEGER REFERENCES classes(id),
+    depth INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    inclusive_time REAL NOT NULL,
+    self_time REAL NOT NULL
+);
+CREATE TABLE functions (
+    id INTEGER PRIMARY KEY,
+    tu_id INTEGER NOT NULL REFERENCES translation_units(id),
+    parent_id INTEGER REFERENCES functions(id),
+    depth INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    inclusive_time REAL NOT NULL,
+    self_time REAL NOT NULL
+);
+"""
+
+# Created once every row is inserted, which is much faster than updating them on every insert.
+RESULTS_DB_INDEXES = """
+CREATE INDEX translation_units_path ON translation_units(path);
+CREATE INDEX includes_name ON includes(name);
+CREATE INDEX includes_path ON includes(path);
+CREATE INDEX includes_tu ON includes(tu_id);
+CREATE INDEX classes_name ON classes(name);
+CREATE INDEX classes_tu ON classes(tu_id);
+CREATE INDEX functions_name ON functions(name);
+CREATE INDEX functions_tu ON functions(tu_id);
+"""
+
+
+def get_tree_columns(tree):
+    """Returns ( names, paths, parents, depths, durations ) of every node of a tree in pre order, root included.
+
+    tree is a CompactTree, a main_ue423 Tree ( anything with to_nodes ) or a main.py Tree.
+    paths holds None for nodes without a path.
+    """
+    if isinstance(tree, CompactTree):
+        names = list(map(tree.get_data, range(len(tree))))
+        paths = [tree.names[path_id] if path_id >= 0 else None for path_id in tree.path_id]
+        return names, paths, tree.parent, tree.depth, tree.duration
+
+    if hasattr(tree, "to_nodes"):
+        nodes = tree.to_nodes()
+        names = [node[0] for node in nodes]
+        durations = [node[1] for node in nodes]
+        depths = [node[5] for node in nodes]
+        parents = []
+        stack = []
+        for index, depth in enumerate(depths):
+            del stack[depth:]
+            parents.append(stack[-1] if stack else -1)
+            stack.append(index)
+        return names, [node[6] for node in nodes], parents, depths, durations
+
+    nodes, parents = flatten_tree(tree)
+    depths = []
+    for parent in parents:
+        depths.append(depths[parent] + 1 if parent >= 0 else 0)
+    return [node.name for node in nodes], [node.path for node in nodes], parents, depths, [node.time for node in nodes]
+
+
+class ResultsDatabase:
+    """SQLite database holding every parsed node, so that results can be queried without parsing the build again.
+
+    Any existing file at path is replaced. Every node of a category tree becomes a row of the includes, classes
+    or functions table, with its translation unit, parent row, depth, inclusive and self time. Tree roots are
+    the translation units themselves and go to the translation_units table instead.
+    """
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # The database is written from scratch in one go, an interrupted export is simply run again.
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.executescript(RESULTS_DB_SCHEMA)
+
+        self.translation_unit_count = 0
+        self.row_counts = {"includes": 0, "classes": 0, "functions": 0}
+        self.pending_rows = {name: [] for name in self.row_counts}
+        self.pending_translation_units = []
+        self.pending_row_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_translation_unit(self, path, headers, classes, functions):
+        """Adds the three trees of a translation unit, any of which can be None."""
+        self.translation_unit_count += 1
+        tu_id = self.translation_unit_count
+        times = []
+        for name, tree in (("includes", headers), ("classes", classes), ("functions", functions)):
+            if tree is None:
+                times.append(None)
+                continue
+
+            names, paths, parents, depths, durations = get_tree_columns(tree)
+            times.append(durations[0])
+
+            # Row ids are handed out here, so that children can point to their parent before anything is inserted.
+            first_id = self.row_counts[name]
+            self.row_counts[name] += len(names) - 1
+            self_times = aggregate_tree(parents, durations).self_duration
+
+            # Node index i > 0 gets the id first_id + i, the root is left out.
+            columns = [range(first_id + 1, first_id + len(names)), itertools.repeat(tu_id),
+                       [first_id + parent if parent > 0 else None for parent in parents[1:]], depths[1:], names[1:]]
+            if name == "includes":
+                columns.append(paths[1:])
+            columns += [durations[1:], self_times[1:]]
+            self.pending_rows[name].extend(zip(*columns))
+            self.pending_row_count += len(names) - 1
+
+        self.pending_translation_units.append((tu_id, path, os.path.basename(path), *times))
+        if self.pending_row_count >= RESULTS_DB_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Inserts every pending row in a single transaction."""
+        with self.connection:
+            self.connection.executemany("INSERT INTO translation_units VALUES (?, ?, ?, ?, ?, ?)", self.pending_translation_units)
+            for name, rows in self.pending_rows.items():
+                if rows:
+                    values = ", ".join("?" * len(rows[0]))
+                    self.connection.executemany("INSERT INTO {} VALUES ({})".format(name, values), rows)
+                    rows.clear()
+        self.pending_translation_units.clear()
+        self.pending_row_count = 0
+
+    def close(self):
+        """Inserts the remaining rows, creates the indexes and closes the database."""
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.executescript(RESULTS_DB_INDEXES)
+        self.connection.execute("ANALYZE")
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+
+
+def is_results_database(path):
+    """Returns True if path is an SQLite database, such as one written by ResultsDatabase."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(16) == b"SQLite format 3\x00"
+
+
+def iter_database_trees(path):
+    """Yields ( translation unit path, category, names, parents, durations ) for every tree of a results database.
+
+    Trees are rebuilt in the format of get_tree_columns: pre order, root first, parents as node indices.
+    Roots are named after the translation unit and hold its total time for the category.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        translation_units = connection.execute(
+            "SELECT id, path, name, includes_time, classes_time, functions_time FROM translation_units ORDER BY id").fetchall()
+
+        for column, category in enumerate(("includes", "classes", "functions"), 3):
+            # Rows were inserted one translation unit at a time in pre order, so ordering by id groups them by TU
+            # with every parent before its children.
+            rows = connection.execute("SELECT tu_id, id, parent_id, name, inclusive_time FROM {} ORDER BY id".format(category))
+            groups = itertools.groupby(rows, operator.itemgetter(0))
+            group = next(groups, None)
+            for translation_unit in translation_units:
+                if translation_unit[column] is None:
+                    continue
+
+                names = [translation_unit[2]]
+                parents = [-1]
+                durations = [translation_unit[column]]
+                if group is not None and group[0] == translation_unit[0]:
+                    indices = {}
+                    for _, row_id, parent_id, name, duration in group[1]:
+                        indices[row_id] = len(names)
+                        parents.append(indices[parent_id] if parent_id is not None else 0)
+                        names.append(name)
+                        durations.append(duration)
+                    group = next(groups, None)
+
+                yield translation_unit[1], category, names, parents, durations
+    finally:
+        connection.close()
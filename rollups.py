@@ -0,0 +1,228 @@
+"""Rolls the compile times of a build up per directory and per Unreal module.
+
+Every translation unit path and every full header path goes into a prefix tree of path components, whose totals
+are then summed up to every parent directory in a single pass. Any depth can be listed without going through
+the translation units again:
+
+    python rollups.py MyProject/Intermediate --depth 6 --modules
+"""
+import argparse
+from array import array
+
+from results_db import get_tree_columns
+from timing_tree import CompactTree, aggregate_tree, is_other_name
+
+TU_COLUMNS = ("tu_count", "frontend_time", "includes_time", "classes_time", "functions_time")
+HEADER_COLUMNS = ("include_count", "include_self_time")
+
+# Folders whose parent is named after the module, in Unreal source trees.
+MODULE_FOLDERS = frozenset(("public", "private", "classes", "internal"))
+
+
+def get_tree_time(tree):
+    """Returns the inclusive time of the root of a tree, 0 for None."""
+    if tree is None:
+        return 0.0
+    elif isinstance(tree, CompactTree):
+        return tree.duration[0]
+    elif hasattr(tree, "to_nodes"):
+        return tree.root.duration
+    return tree.time
+
+
+def split_path(path):
+    """Returns the components of a path using \\ or / as separators."""
+    return [part for part in path.replace("\\", "/").split("/") if part]
+
+
+def get_module_name(path):
+    """Returns the Unreal module a source, header or timing file belongs to, or None if the path doesn't tell.
+
+    Headers and sources are in Module/Public, Module/Private or Module/Classes, timing files in
+    Intermediate/Build/Platform/Target/Configuration/Module, and unity files are named Module.Name.cpp.
+    """
+    parts = split_path(path)
+    lower_parts = [part.lower() for part in parts]
+    for index in range(len(parts) - 2, 0, -1):
+        if lower_parts[index] in MODULE_FOLDERS:
+            return parts[index - 1]
+
+    if "intermediate" in lower_parts and len(parts) >= 2:
+        return parts[-2]
+
+    name = parts[-1] if parts else ""
+    if name.startswith("Module."):
+        return name.split(".")[1]
+    return None
+
+
+class PathTrie:
+    """Prefix tree of paths with one node per directory or file, each holding a value per column.
+
+    Values added to a node are rolled up to every parent by rollup. Children are always created after their
+    parent, so walking nodes backwards visits every subtree before its root, like aggregate_tree.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = [""]
+        self.parents = array("i", [-1])
+        self.depths = array("i", [0])
+        # Lower case component -> child index, one dict per node.
+        self.children = [{}]
+        self.values = {column: array("d", [0.0]) for column in columns}
+        # Values rolled up to every parent, computed by rollup.
+        self.totals = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def insert(self, path):
+        """Returns the index of the node of path, creating it and its parents as needed. Components are compared case insensitively."""
+        node = 0
+        for part in split_path(path):
+            key = part.lower()
+            child = self.children[node].get(key)
+            if child is None:
+                child = self.children[node][key] = len(self.names)
+                self.names.append(part)
+                self.parents.append(node)
+                self.depths.append(self.depths[node] + 1)
+                self.children.append({})
+                for values in self.values.values():
+                    values.append(0.0)
+            node = child
+        return node
+
+    def add(self, path, **values):
+        """Adds values ( column -> value ) to the node of path."""
+        node = self.insert(path)
+        for column, value in values.items():
+            self.values[column][node] += value
+        self.totals = None
+
+    def rollup(self):
+        """Sums the values of every node up to its parents, in O(n)."""
+        if self.totals is None:
+            parents = self.parents
+            self.totals = {}
+            for column, values in self.values.items():
+                totals = array("d", values)
+                for index in range(len(totals) - 1, 0, -1):
+                    totals[parents[index]] += totals[index]
+                self.totals[column] = totals
+        return self.totals
+
+    def find(self, path):
+        """Returns the index of the node of path, or None if nothing was added below it."""
+        node = 0
+        for part in split_path(path):
+            node = self.children[node].get(part.lower())
+            if node is None:
+                return None
+        return node
+
+    def get_path(self, node):
+        parts = []
+        while node > 0:
+            parts.append(self.names[node])
+            node = self.parents[node]
+        return "\\".join(reversed(parts))
+
+    def get_rollup(self, node):
+        """Returns the rolled up values of a node, column -> value."""
+        totals = self.rollup()
+        return {column: totals[column][node] for column in self.columns}
+
+    def iter_depth(self, depth):
+        """Yields the index of every node depth components below the root."""
+        return (node for node in range(len(self)) if self.depths[node] == depth)
+
+
+class RollupIndex:
+    """Times of a build per directory and per module, fed one record at a time.
+
+    Translation units add their frontend ( includes, classes and functions together ) and per category times to
+    the directories and module of their path. Every include adds its self time to the directories and module of
+    the header, self times being additive where inclusive times of nested headers would be counted twice. Includes
+    without a path, like the nodes collapsing includes shorter than a minimum time, are left out of the header rollups.
+    """
+
+    def __init__(self):
+        self.translation_units = PathTrie(TU_COLUMNS)
+        self.headers = PathTrie(HEADER_COLUMNS)
+        # Module name -> column -> value, with both TU_COLUMNS and HEADER_COLUMNS.
+        self.modules = {}
+
+    def add_module_values(self, path, values):
+        module = get_module_name(path)
+        if module is not None:
+            module_values = self.modules.get(module)
+            if module_values is None:
+                module_values = self.modules[module] = dict.fromkeys(TU_COLUMNS + HEADER_COLUMNS, 0.0)
+            for column, value in values.items():
+                module_values[column] += value
+
+    def add_record(self, record):
+        """Adds a LogRecord or a TimingFile."""
+        times = [get_tree_time(tree) for tree in (record.headers, record.classes, record.functions)]
+        values = {"tu_count": 1, "frontend_time": sum(times), "includes_time": times[0], "classes_time": times[1], "functions_time": times[2]}
+        self.translation_units.add(record.path, **values)
+        self.add_module_values(record.path, values)
+
+        if record.headers is not None:
+            names, paths, parents, depths, durations = get_tree_columns(record.headers)
+            self_times = aggregate_tree(parents, durations).self_duration
+            for index in range(1, len(names)):
+                path = paths[index]
+                if path is None or is_other_name(names[index]):
+                    continue
+                values = {"include_count": 1, "include_self_time": self_times[index]}
+                self.headers.add(path, **values)
+                self.add_module_values(path, values)
+
+
+def format_values(values):
+    """Formats column -> value pairs, counts as integers and times in seconds."""
+    return "  ".join("{}: {}".format(column, int(value) if column.endswith("_count") else "{:.3f}s".format(value))
+                     for column, value in values.items())
+
+
+def print_trie(trie, depth, sort_column, count):
+    totals = trie.rollup()
+    nodes = sorted(trie.iter_depth(depth), key=lambda node: totals[sort_column][node], reverse=True)[:count]
+    for node in nodes:
+        print("  {}  {}".format(format_values(trie.get_rollup(node)), trie.get_path(node)))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Rolls the compile times of a build up per directory and per module.")
+    parser.add_argument("path", help="log, .cpp.timing.txt file or folder of them, - reads a log from stdin")
+    parser.add_argument("--depth", type=int, default=1, help="number of path components of the directories listed (default: 1)")
+    parser.add_argument("--modules", action="store_true", help="also list the modules")
+    parser.add_argument("-n", "--count", type=int, default=20, help="entries listed per table (default: 20)")
+    return parser.parse_args()
+
+
+def main():
+    import compile_times
+
+    arguments = parse_arguments()
+    index = RollupIndex()
+    for record in compile_times.iter_records(arguments.path, compact=True):
+        index.add_record(record)
+
+    print("Translation unit directories:")
+    print_trie(index.translation_units, arguments.depth, "frontend_time", arguments.count)
+    print("Header directories:")
+    print_trie(index.headers, arguments.depth, "include_self_time", arguments.count)
+
+    if arguments.modules:
+        print("Modules:")
+        modules = sorted(index.modules.items(), key=lambda item: (item[1]["frontend_time"], item[1]["include_self_time"]), reverse=True)
+        for module, values in modules[:arguments.count]:
+            print("  {}  {}".format(format_values(values), module))
+
+
+if __name__ == "__main__":
+    main()
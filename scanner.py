@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Folders of an Intermediate tree that never hold timing files: generated headers, project files, shader and
+# asset caches... Compared case insensitively.
+PRUNED_DIRECTORIES = frozenset(name.lower() for name in (
+    ".git", ".vs", "Inc", "ProjectFiles", "ShaderAutogen", "ShaderDebugInfo", "PipelineCaches",
+    "CachedAssetRegistry", "AssetRegistryCache", "DerivedDataCache", "ReimportCache", "Config",
+    "TextureCompression", "StagedBuilds"))
+
+PLATFORMS = frozenset(name.lower() for name in (
+    "Win64", "Win32", "HoloLens", "Mac", "Linux", "LinuxAArch64", "Android", "IOS", "TVOS", "Lumin",
+    "HTML5", "PS4", "PS5", "XboxOne", "XSX", "Switch"))
+
+CONFIGURATIONS = frozenset(name.lower() for name in ("Debug", "DebugGame", "Development", "Shipping", "Test"))
+
+# Directories per batch of concurrent scans, the calls spend most of their time waiting on the file system.
+SCAN_THREADS = 8
+
+# Bump whenever the manifest layout changes, older manifests are then ignored.
+MANIFEST_VERSION = 1
+
+# A directory modified less than this many seconds before the scan may change again within the same
+# timestamp, its entries are not trusted on the next scan.
+MTIME_GRANULARITY = 2.0
+
+
+class DirectoryFilter:
+    """Decides which sub directories are scanned.
+
+    platforms and configurations ( None keeps all ) only apply to the first folder named after a known platform,
+    respectively configuration, on the way down, and pruned names stop applying below both: in
+    Build/Win64/UE4Editor/Development/Test, the module folder Test is kept whatever the configurations.
+    """
+
+    def __init__(self, platforms=None, configurations=None, pruned=PRUNED_DIRECTORIES):
+        self.platforms = frozenset(name.lower() for name in platforms) if platforms else None
+        self.configurations = frozenset(name.lower() for name in configurations) if configurations else None
+        self.pruned = frozenset(pruned)
+
+    def get_key(self):
+        """Options the scan depends on, a manifest made with other options is ignored."""
+        return [sorted(self.platforms or []), sorted(self.configurations or []), sorted(self.pruned)]
+
+    def get_child_state(self, name, state):
+        """Returns the state of a sub directory called name of a directory in state, or None to skip it.
+        The state tells whether a platform and a configuration folder were already passed."""
+        platform_found, configuration_found = state
+        lower_name = name.lower()
+        if lower_name in self.pruned and not (platform_found and configuration_found):
+            return None
+        if not platform_found and lower_name in PLATFORMS:
+            if self.platforms is not None and lower_name not in self.platforms:
+                return None
+            return True, configuration_found
+        if not configuration_found and lower_name in CONFIGURATIONS:
+            if self.configurations is not None and lower_name not in self.configurations:
+                return None
+            return platform_found, True
+        return state
+
+
+class FileScanner:
+    """Finds the files accepted by name_filter below a folder, the same files in the same order as os.walk would
+    but skipping the folders rejected by a DirectoryFilter.
+
+    Directories are listed with os.scandir, a level of the tree at a time over several threads. With a manifest
+    path the list of every directory is stored along with its modification time, and the next scan only lists
+    the directories whose time changed, which is a single stat per directory for an unchanged tree.
+    """
+
+    def __init__(self, name_filter, directory_filter=None, manifest_path=None, threads=SCAN_THREADS):
+        self.name_filter = name_filter
+        self.directory_filter = directory_filter or DirectoryFilter()
+        self.manifest_path = manifest_path
+        self.threads = threads
+        # Directories scanned and directories whose previous listing was reused by the last scan.
+        self.scanned_count = 0
+        self.reused_count = 0
+
+    def load_manifest(self, root):
+        """Returns the directories of the manifest ( path -> [ mtime, sub directories, files ] ) if it matches this scan."""
+        if not self.manifest_path:
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("root") != root or manifest.get("filter") != self.directory_filter.get_key():
+            return {}
+        return manifest["directories"]
+
+    def save_manifest(self, root, directories):
+        manifest = {"version": MANIFEST_VERSION, "root": root, "filter": self.directory_filter.get_key(), "directories": directories}
+        temporary_path = self.manifest_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, separators=(",", ":"))
+        os.replace(temporary_path, self.manifest_path)
+
+    def scan_directory(self, path, state, known, scan_start):
+        """Returns [ mtime, sub directories, files ] of a directory, reusing known if its time didn't change,
+        and whether it was reused. Returns None, False for a directory that can't be read."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if known and known[0] == mtime:
+                return known, True
+
+            directories = []
+            files = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        # Like os.walk, symbolic links to directories are not followed.
+                        if not entry.is_symlink() and self.directory_filter.get_child_state(entry.name, state) is not None:
+                            directories.append(entry.name)
+                    elif self.name_filter(entry.name):
+                        files.append(entry.name)
+        except OSError:
+            return None, False
+
+        if mtime / 1e9 > scan_start - MTIME_GRANULARITY:
+            mtime = None
+        return [mtime, directories, files], False
+
+    def scan(self, root):
+        """Returns the paths of the matching files below root."""
+        root = os.fspath(root)
+        known_directories = self.load_manifest(root)
+        directories = {}
+        self.scanned_count = 0
+        self.reused_count = 0
+        scan_start = time.time()
+
+        pending = [(root, (False, False))]
+        with ThreadPoolExecutor(self.threads) as pool:
+            while pending:
+                results = pool.map(lambda item: self.scan_directory(item[0], item[1], known_directories.get(item[0]), scan_start), pending)
+                next_pending = []
+                for (path, state), (listing, reused) in zip(pending, results):
+                    if listing is None:
+                        continue
+                    directories[path] = listing
+                    self.scanned_count += 1
+                    self.reused_count += reused
+                    for name in listing[1]:
+                        next_pending.append((os.path.join(path, name), self.directory_filter.get_child_state(name, state)))
+                pending = next_pending
+
+        if self.manifest_path:
+            self.save_manifest(root, directories)
+
+        # Depth first, files of a directory before those of its sub directories, like os.walk.
+        paths = []
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            listing = directories.get(path)
+            if listing is not None:
+                paths += [os.path.join(path, name) for name in listing[2]]
+                stack += [os.path.join(path, name) for name in reversed(listing[1])]
+        return paths
@@ -0,0 +1,460 @@
+"""Partial results of a build that can be parsed separately, e.g. on every agent of a distributed build, and merged.
+
+A shard holds the trees of every translation unit it covers along with tables of header, class and function
+times already aggregated over them. Merging sums the tables and copies the trees without decoding them, so
+combining many shards costs little more than copying the files:
+
+    python shards.py write Agent1/Log.txt Agent1.shard
+    python shards.py write Agent2/Intermediate Agent2.shard
+    python shards.py merge Build.shard Agent1.shard Agent2.shard
+    python shards.py report Build.shard
+
+Shards can also be given to compile_times.iter_records, and so to every tool reading a build, like a log.
+"""
+import argparse
+import json
+import operator
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import namedtuple
+
+from header_index import HeaderCost, HeaderIndex
+from results_db import get_tree_columns
+from symbols import SYMBOLS
+from timing_tree import CompactTree, aggregate_tree, is_other_name
+
+SHARD_MAGIC = b"CompileTimesShard\n"
+
+# Bump whenever the layout of shards changes, older shards are then rejected.
+SHARD_VERSION = 2
+
+# Every block is its byte size followed by zlib compressed data, the file ends with the offset of the summary block.
+# Shards may come from other machines, so they only hold plain data: JSON and little endian arrays, never pickles.
+BLOCK_HEADER = struct.Struct("<Q")
+FOOTER = struct.Struct("<Q")
+
+# A translation unit block is the size of its JSON part, the JSON part ( path, name and the names used by every tree )
+# and the columns of every tree one after the other.
+JSON_HEADER = struct.Struct("<I")
+TREE_COLUMNS = (("name_id", "i"), ("path_id", "i"), ("parent", "i"), ("duration", "d"))
+
+CATEGORIES = ("includes", "classes", "functions")
+
+# Columns of the summary tables, keyed by header path or by class or function name.
+HEADER_COLUMNS = ("include_count", "inclusive_time", "exclusive_time", "tu_count")
+NAME_COLUMNS = ("count", "inclusive_time", "self_time")
+
+
+class ShardRecord(namedtuple("ShardRecord", ["path", "name", "headers", "classes", "functions"])):
+    """Translation unit read back from a shard, trees are CompactTree instances or None."""
+    __slots__ = ()
+
+
+def to_compact_tree(tree):
+    """Returns a CompactTree holding the nodes of any tree, so that shards can be read without the parser modules."""
+    if tree is None or type(tree) is CompactTree:
+        return tree
+
+    names, paths, parents, depths, durations = get_tree_columns(tree)
+    compact_tree = CompactTree(names[0], durations[0])
+    for index in range(1, len(names)):
+        compact_tree.add_node(parents[index], names[index], durations[index], paths[index])
+    return compact_tree
+
+
+def make_summary():
+    """Returns an empty summary: sources, translation unit count, total time of every category and the tables."""
+    return {"sources": [], "translation_units": 0, "times": dict.fromkeys(CATEGORIES, 0.0),
+            "headers": {}, "classes": {}, "functions": {}}
+
+
+def add_table_rows(table, rows):
+    """Sums rows ( key -> values ) into table."""
+    for key, values in rows.items():
+        row = table.get(key)
+        if row is None:
+            table[key] = list(values)
+        else:
+            for index, value in enumerate(values):
+                row[index] += value
+
+
+def merge_summary(summary, other):
+    """Adds the summary of another shard to summary. Header tu_count columns are only exact for shards
+    covering different translation units, like the agents of a distributed build."""
+    summary["sources"] += other["sources"]
+    summary["translation_units"] += other["translation_units"]
+    for category in CATEGORIES:
+        summary["times"][category] += other["times"][category]
+    for table in ("headers", "classes", "functions"):
+        add_table_rows(summary[table], other[table])
+
+
+def add_name_rows(table, tree):
+    """Adds the count, inclusive and self time of every node of a class or function tree, per name."""
+    names, paths, parents, depths, durations = get_tree_columns(tree)
+    self_times = aggregate_tree(parents, durations).self_duration
+    for index in range(1, len(names)):
+        name = names[index]
+        if is_other_name(name):
+            continue
+        row = table.get(name)
+        if row is None:
+            table[name] = [1, durations[index], self_times[index]]
+        else:
+            row[0] += 1
+            row[1] += durations[index]
+            row[2] += self_times[index]
+
+
+def get_column_bytes(values):
+    """Returns the bytes of an array in little endian order."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_translation_unit(path, name, trees):
+    """Returns the content of the block of a translation unit, trees being CompactTree instances or None."""
+    metadata = {"path": path, "name": name, "trees": []}
+    columns = []
+    for tree in trees:
+        if tree is None:
+            metadata["trees"].append(None)
+            continue
+
+        # Symbol ids only mean something in this process, the tree's names are stored along with it and ids renumbered to index them.
+        local_ids = {}
+        name_id = array("i", [local_ids.setdefault(name_id, len(local_ids)) for name_id in tree.name_id])
+        path_id = array("i", [local_ids.setdefault(path_id, len(local_ids)) if path_id >= 0 else -1 for path_id in tree.path_id])
+        metadata["trees"].append({"count": len(tree), "names": list(map(tree.symbols.names.__getitem__, local_ids))})
+        columns += [name_id, path_id, tree.parent, tree.duration]
+
+    metadata = json.dumps(metadata, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join([JSON_HEADER.pack(len(metadata)), metadata] + list(map(get_column_bytes, columns)))
+
+
+def decode_tree(names, columns):
+    """Rebuilds a CompactTree from the names and columns of a shard. Every index is checked, as shards can come from other machines."""
+    name_id, path_id, parent, duration = columns
+    if not all(isinstance(name, str) for name in names):
+        raise ValueError("names must be strings")
+    symbol_ids = [SYMBOLS.intern(name) for name in names]
+    name_count = len(symbol_ids)
+    if not name_id or parent[0] != -1 or not 0 <= name_id[0] < name_count:
+        raise ValueError("tree without a root")
+
+    tree = CompactTree(names[name_id[0]], duration[0])
+    for index in range(1, len(name_id)):
+        if not 0 <= parent[index] < index or not 0 <= name_id[index] < name_count or not -1 <= path_id[index] < name_count:
+            raise ValueError("node {} is out of range".format(index))
+        tree.add_symbol_node(parent[index], symbol_ids[name_id[index]], duration[index],
+                             symbol_ids[path_id[index]] if path_id[index] >= 0 else -1)
+    tree.cache_useful_data()
+    return tree
+
+
+def decode_translation_unit(data, path):
+    """Returns the ShardRecord of the content of a translation unit block of the shard at path."""
+    try:
+        size, = JSON_HEADER.unpack_from(data)
+        offset = JSON_HEADER.size + size
+        metadata = json.loads(data[JSON_HEADER.size:offset].decode("utf-8"))
+
+        trees = []
+        for tree_metadata in metadata["trees"]:
+            if tree_metadata is None:
+                trees.append(None)
+                continue
+
+            count = tree_metadata["count"]
+            columns = []
+            for column, typecode in TREE_COLUMNS:
+                values = array(typecode)
+                end = offset + values.itemsize * count
+                if count < 0 or end > len(data):
+                    raise ValueError("column {} is truncated".format(column))
+                values.frombytes(data[offset:end])
+                if sys.byteorder == "big":
+                    values.byteswap()
+                columns.append(values)
+                offset = end
+            trees.append(decode_tree(tree_metadata["names"], columns))
+
+        if len(trees) != len(CATEGORIES) or not isinstance(metadata["path"], str) or not isinstance(metadata["name"], str):
+            raise ValueError("unexpected translation unit fields")
+        return ShardRecord(metadata["path"], metadata["name"], *trees)
+    except (KeyError, TypeError, ValueError, IndexError, struct.error) as error:
+        raise RuntimeError("{} holds a malformed translation unit: {}".format(path, error))
+
+
+def write_block(file, data):
+    data = zlib.compress(data)
+    file.write(BLOCK_HEADER.pack(len(data)))
+    file.write(data)
+
+
+def read_block(file, path):
+    header = file.read(BLOCK_HEADER.size)
+    if len(header) != BLOCK_HEADER.size:
+        raise RuntimeError("{} is truncated".format(path))
+    size, = BLOCK_HEADER.unpack(header)
+    data = file.read(size)
+    if len(data) != size:
+        raise RuntimeError("{} is truncated".format(path))
+    try:
+        return zlib.decompress(data)
+    except zlib.error:
+        raise RuntimeError("{} is corrupt".format(path))
+
+
+def read_summary(file, path):
+    """Reads the summary block of the shard at path, checking it has the layout of make_summary."""
+    try:
+        summary = json.loads(read_block(file, path).decode("utf-8"))
+        expected = make_summary()
+        if not isinstance(summary, dict) or summary.keys() != expected.keys() or \
+                any(not isinstance(summary[key], type(value)) for key, value in expected.items()):
+            raise ValueError("unexpected fields")
+    except ValueError as error:
+        raise RuntimeError("{} holds a malformed summary: {}".format(path, error))
+    return summary
+
+
+def write_header(file):
+    file.write(SHARD_MAGIC)
+    file.write(struct.pack("<I", SHARD_VERSION))
+
+
+def write_footer(file, summary):
+    offset = file.tell()
+    write_block(file, json.dumps(summary, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    file.write(FOOTER.pack(offset))
+
+
+def is_same_file(path, other_path):
+    try:
+        return os.path.samefile(path, other_path)
+    except OSError:
+        return False
+
+
+class ShardWriter:
+    """Writes the translation units of part of a build to a shard, translation units being written as they are added.
+
+    Any existing file at path is replaced. The summary tables are computed along the way and written last.
+    source names what the shard was made from, e.g. the log or the agent.
+    """
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.file = open(path, "wb")
+        write_header(self.file)
+        self.summary = make_summary()
+        self.summary["sources"].append(source or path)
+        self.header_index = HeaderIndex()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_translation_unit(self, path, headers, classes, functions, name=None):
+        """Adds the three trees of a translation unit, any of which can be None."""
+        trees = [to_compact_tree(tree) for tree in (headers, classes, functions)]
+        write_block(self.file, encode_translation_unit(path, name or path, trees))
+
+        summary = self.summary
+        summary["translation_units"] += 1
+        for category, tree in zip(CATEGORIES, trees):
+            if tree is not None:
+                summary["times"][category] += tree.duration[0]
+        if trees[0] is not None:
+            self.header_index.add_tree(trees[0])
+        for category, tree in zip(CATEGORIES[1:], trees[1:]):
+            if tree is not None:
+                add_name_rows(summary[category], tree)
+
+    def add_record(self, record):
+        """Adds a LogRecord, a TimingFile or a ShardRecord."""
+        self.add_translation_unit(record.path, record.headers, record.classes, record.functions, record.name)
+
+    def close(self):
+        """Writes the summary and closes the shard."""
+        if self.file is None:
+            return
+        headers = self.summary["headers"]
+        for cost in self.header_index.get_header_costs():
+            headers[cost.path] = [cost.include_count, cost.inclusive_time, cost.exclusive_time, cost.tu_count]
+        write_footer(self.file, self.summary)
+        self.file.close()
+        self.file = None
+
+
+def is_shard(path):
+    """Returns True if path is a file written by ShardWriter or merge_shards."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(SHARD_MAGIC)) == SHARD_MAGIC
+
+
+def open_shard(path):
+    """Opens a shard, returns the file positioned on its first translation unit and the offset of its summary."""
+    file = open(path, "rb")
+    try:
+        if file.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise RuntimeError("{} is not a shard".format(path))
+        version, = struct.unpack("<I", file.read(4))
+        if version != SHARD_VERSION:
+            raise RuntimeError("{} is a version {} shard, expected version {}".format(path, version, SHARD_VERSION))
+
+        start = file.tell()
+        file.seek(-FOOTER.size, os.SEEK_END)
+        summary_offset, = FOOTER.unpack(file.read(FOOTER.size))
+        if not start <= summary_offset < file.tell():
+            raise RuntimeError("{} is truncated".format(path))
+        file.seek(start)
+    except (OSError, struct.error):
+        file.close()
+        raise RuntimeError("{} is truncated".format(path))
+    except RuntimeError:
+        file.close()
+        raise
+    return file, summary_offset
+
+
+def read_shard_summary(path):
+    """Returns the summary of a shard without reading its translation units."""
+    file, summary_offset = open_shard(path)
+    with file:
+        file.seek(summary_offset)
+        return read_summary(file, path)
+
+
+def iter_shard_records(path):
+    """Yields a ShardRecord for every translation unit of a shard, one at a time."""
+    file, summary_offset = open_shard(path)
+    with file:
+        while file.tell() < summary_offset:
+            yield decode_translation_unit(read_block(file, path), path)
+
+
+def merge_shards(output_path, paths):
+    """Writes a shard holding every translation unit of the shards at paths, with their tables summed.
+    Returns the merged summary. output_path can't be one of paths, which it would overwrite before reading it."""
+    for path in paths:
+        if is_same_file(output_path, path):
+            raise RuntimeError("Can't merge {} into itself, write the merged shard to another file".format(path))
+
+    # Every summary is read before the output is opened, so that a shard that can't be read doesn't leave a partial output.
+    summary = make_summary()
+    for path in paths:
+        merge_summary(summary, read_shard_summary(path))
+
+    with open(output_path, "wb") as output:
+        write_header(output)
+        for path in paths:
+            file, summary_offset = open_shard(path)
+            with file:
+                # Translation units are copied as is.
+                start = file.tell()
+                remaining = summary_offset - start
+                while remaining > 0:
+                    data = file.read(min(remaining, 1024 * 1024))
+                    if not data:
+                        raise RuntimeError("{} is truncated".format(path))
+                    output.write(data)
+                    remaining -= len(data)
+        write_footer(output, summary)
+    return summary
+
+
+def get_header_costs(summary):
+    """Returns a HeaderCost for every header of a summary."""
+    return [HeaderCost(path, *row) for path, row in summary["headers"].items()]
+
+
+def print_summary(summary, count):
+    print("{} translation units from {}".format(summary["translation_units"], ", ".join(summary["sources"])))
+    for category in CATEGORIES:
+        print("  {}: {:.3f}s".format(category, summary["times"][category]))
+
+    costs = get_header_costs(summary)
+    print("Slowest headers by exclusive time:")
+    for cost in sorted(costs, key=operator.attrgetter("exclusive_time"), reverse=True)[:count]:
+        print("  {:10.3f}s  total {:.3f}s  included {} times in {} files  {}".format(
+            cost.exclusive_time, cost.inclusive_time, cost.include_count, cost.tu_count, cost.path))
+
+    print("Precompiled header candidates:")
+    candidates = sorted((cost for cost in costs if cost.tu_count >= 2), key=operator.attrgetter("pch_savings"), reverse=True)
+    for cost in candidates[:count]:
+        print("  saves ~{:.3f}s  included in {} files  {}".format(cost.pch_savings, cost.tu_count, cost.path))
+
+    for category in CATEGORIES[1:]:
+        print("Slowest {} by inclusive time:".format(category))
+        rows = sorted(summary[category].items(), key=lambda item: item[1][1], reverse=True)
+        for name, (node_count, inclusive_time, self_time) in rows[:count]:
+            print("  {:10.3f}s  self {:.3f}s  {} times  {}".format(inclusive_time, self_time, node_count, name))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Writes, merges and reports shards of partial build results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    write_parser = commands.add_parser("write", help="parse part of a build into a shard")
+    write_parser.add_argument("path", help="log, .cpp.timing.txt file or folder of them, - reads a log from stdin")
+    write_parser.add_argument("output", help="shard to write, replacing it")
+    write_parser.add_argument("--source", help="name of the part of the build, e.g. the agent (default: path)")
+    write_parser.add_argument("--min-time", type=float, default=0.0, metavar="SECONDS",
+                              help="collapse nodes shorter than SECONDS into an \"other\" node per parent")
+
+    merge_parser = commands.add_parser("merge", help="merge shards into a single shard")
+    merge_parser.add_argument("output", help="shard to write, replacing it")
+    merge_parser.add_argument("shards", nargs="+", help="shards to merge")
+
+    report_parser = commands.add_parser("report", help="print the tables of one or more shards, summed")
+    report_parser.add_argument("shards", nargs="+", help="shards to report")
+    report_parser.add_argument("-n", "--count", type=int, default=20, help="entries listed per table (default: 20)")
+    return parser.parse_args()
+
+
+def run(arguments):
+    if arguments.command == "write":
+        import compile_times
+
+        if is_same_file(arguments.path, arguments.output):
+            raise RuntimeError("Can't write {} over itself, write the shard to another file".format(arguments.path))
+
+        with ShardWriter(arguments.output, arguments.source or arguments.path) as writer:
+            for record in compile_times.iter_records(arguments.path, compact=True, min_time=arguments.min_time):
+                writer.add_record(record)
+        print("{} translation units written to {}".format(writer.summary["translation_units"], arguments.output))
+
+    elif arguments.command == "merge":
+        summary = merge_shards(arguments.output, arguments.shards)
+        print("{} translation units from {} shards merged into {}".format(summary["translation_units"], len(arguments.shards), arguments.output))
+
+    else:
+        summary = make_summary()
+        for path in arguments.shards:
+            merge_summary(summary, read_shard_summary(path))
+        print_summary(summary, arguments.count)
+
+
+def main():
+    arguments = parse_arguments()
+    try:
+        run(arguments)
+    except (OSError, RuntimeError) as error:
+        # Missing or malformed shards and outputs that would overwrite an input are reported without a traceback.
+        sys.exit("shards.py: error: {}".format(error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+class SymbolTable:
+    """Interns strings ( header paths, file, class and function names ) into dense integer ids.
+
+    Every distinct string is stored once, however many trees and translation units use it,
+    and aggregations can be keyed by ids instead of strings.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        # Symbol id of a path -> symbol id of its file name, filled as paths are seen.
+        self.basename_ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, name):
+        """Returns the id of name, adding it if needed."""
+        symbol_id = self.ids.get(name)
+        if symbol_id is None:
+            symbol_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return symbol_id
+
+    def get(self, symbol_id):
+        return self.names[symbol_id]
+
+    def intern_string(self, name):
+        """Returns the stored copy of name, so that equal names are a single string object."""
+        return self.names[self.intern(name)]
+
+    def intern_basename(self, path_id):
+        """Returns the id of the file name of the path with id path_id. Paths can use \\ or / as separators.
+        The file name is only computed the first time a path is seen."""
+        basename_id = self.basename_ids.get(path_id)
+        if basename_id is None:
+            path = self.names[path_id]
+            basename = path[max(path.rfind("\\"), path.rfind("/")) + 1:]
+            basename_id = self.basename_ids[path_id] = self.intern(basename)
+        return basename_id
+
+    def basename(self, path):
+        """Returns the interned file name of path."""
+        return self.names[self.intern_basename(self.intern(path))]
+
+
+# Symbols of this process, shared by every tree. Ids are only meaningful within a process,
+# trees sent to other processes carry their names along ( see CompactTree.__getstate__ ).
+SYMBOLS = SymbolTable()
@@ -0,0 +1,323 @@
+import operator
+from array import array
+
+from symbols import SYMBOLS
+
+# Name of the node holding the children of a parent that were shorter than a minimum time, see OtherBuckets.
+OTHER_NAME = "other ({} items)"
+
+
+def is_other_name(name):
+    return name.startswith("other (") and name.endswith(" items)")
+
+
+class OtherBuckets:
+    """Time and number of the children collapsed under every open node, while a tree is parsed top down.
+
+    Nodes are identified by their depth in the stack of open nodes. When a node is closed its bucket becomes
+    a single "other (N items)" child, whose time is the sum of the collapsed children's inclusive times:
+    the times of every node that is kept, and so the totals, are exactly those of the full tree.
+    """
+
+    def __init__(self, min_time):
+        self.min_time = min_time
+        # Depth -> [ time, count ].
+        self.buckets = {}
+
+    def add(self, depth, time):
+        bucket = self.buckets.get(depth)
+        if bucket is None:
+            self.buckets[depth] = [time, 1]
+        else:
+            bucket[0] += time
+            bucket[1] += 1
+
+    def pop(self, depth):
+        """Returns ( name, time ) of the node collapsing the children of the node at depth, or None if it has none."""
+        bucket = self.buckets.pop(depth, None)
+        if bucket is None:
+            return None
+        return OTHER_NAME.format(bucket[1]), bucket[0]
+
+
+def iter_pre_order(root, get_children=operator.attrgetter("children")):
+    """Yields every node of an object tree in pre order, without recursion."""
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(get_children(node)))
+
+
+def flatten_tree(root, get_children=operator.attrgetter("children")):
+    """Returns ( nodes, parents ): every node of an object tree in pre order, and the index of its parent ( -1 for the root )."""
+    nodes = []
+    parents = array("i")
+    stack = [(root, -1)]
+    while stack:
+        node, parent = stack.pop()
+        parents.append(parent)
+        nodes.append(node)
+        stack.extend((child, len(nodes) - 1) for child in reversed(get_children(node)))
+    return nodes, parents
+
+
+class TreeAggregates:
+    """Results of aggregate_tree, one array entry per node."""
+
+    def __init__(self, count):
+        # Direct children only.
+        self.self_child_count = array("i", bytes(4 * count))
+        # Includes full subtree.
+        self.child_count = array("i", bytes(4 * count))
+        # Direct children that have children of their own, like TreeNode counts them.
+        self.self_leaf_child_count = array("i", bytes(4 * count))
+        # Sum of the inclusive durations of the direct children.
+        self.children_duration = array("d", bytes(8 * count))
+        # Inclusive duration minus children_duration.
+        self.self_duration = array("d")
+
+
+def aggregate_tree(parents, durations):
+    """Aggregates a tree stored in pre order ( see flatten_tree and CompactTree ) in O(n), without recursion.
+
+    parents holds the index of the parent of every node, durations its inclusive duration.
+    """
+    count = len(parents)
+    aggregates = TreeAggregates(count)
+    self_child_counts = aggregates.self_child_count
+    child_counts = aggregates.child_count
+    self_leaf_child_counts = aggregates.self_leaf_child_count
+    children_durations = aggregates.children_duration
+
+    # Walking backwards is a post order pass: a node's subtree is done by the time the node is reached.
+    for index in range(count - 1, 0, -1):
+        parent = parents[index]
+        self_child_counts[parent] += 1
+        child_counts[parent] += child_counts[index] + 1
+        if self_child_counts[index]:
+            self_leaf_child_counts[parent] += 1
+
+    # Summed in pre order so the result matches sum() over a children list exactly.
+    for index in range(1, count):
+        children_durations[parents[index]] += durations[index]
+
+    aggregates.self_duration = array("d", map(operator.sub, durations, children_durations))
+    return aggregates
+
+
+class CompactTree:
+    """Tree stored as parallel arrays instead of one Python object per node.
+
+    Nodes are appended in pre order, so a node is always followed by its whole subtree.
+    Node 0 is the root. Names are interned in a SymbolTable shared by every tree ( SYMBOLS by default ):
+    every node only stores a symbol id, an index into names.
+    Nodes can also have a path ( e.g. the full path of a header whose data is its file name ), stored the same way.
+    The self_duration, child_count and self_leaf_child_count arrays are filled by cache_useful_data.
+    """
+
+    def __init__(self, root_data="", root_duration=0.0, symbols=SYMBOLS):
+        self.symbols = symbols
+
+        self.name_id = array("i")
+        self.path_id = array("i")
+        self.parent = array("i")
+        self.depth = array("i")
+        self.duration = array("d")
+        self.self_child_count = array("i")
+
+        # Cached. Excludes children.
+        self.self_duration = array("d")
+        # Cached. Includes full subtree.
+        self.child_count = array("i")
+        # Cached. Counts direct children that have children of their own, like TreeNode.
+        self.self_leaf_child_count = array("i")
+
+        self.add_node(-1, root_data, root_duration)
+
+    def __len__(self):
+        return len(self.name_id)
+
+    def __getstate__(self):
+        # Symbol ids only mean something in this process, so the tree carries the names it uses
+        # and ids are renumbered to index them.
+        state = self.__dict__.copy()
+        del state["symbols"]
+        local_ids = {}
+        state["name_id"] = array("i", [local_ids.setdefault(name_id, len(local_ids)) for name_id in self.name_id])
+        state["path_id"] = array("i", [local_ids.setdefault(path_id, len(local_ids)) if path_id >= 0 else -1 for path_id in self.path_id])
+        state["names"] = list(map(self.symbols.names.__getitem__, local_ids))
+        return state
+
+    def __setstate__(self, state):
+        names = state.pop("names")
+        self.__dict__.update(state)
+        self.symbols = SYMBOLS
+        symbol_ids = list(map(SYMBOLS.intern, names))
+        self.name_id = array("i", map(symbol_ids.__getitem__, self.name_id))
+        self.path_id = array("i", [symbol_ids[path_id] if path_id >= 0 else -1 for path_id in self.path_id])
+
+    @property
+    def root(self):
+        return CompactTreeNode(self, 0)
+
+    @property
+    def names(self):
+        return self.symbols.names
+
+    def intern(self, name):
+        """Returns the symbol id of name, adding it if needed."""
+        return self.symbols.intern(name)
+
+    def add_node(self, parent, data, duration, path=None):
+        """Appends a child of the node at index parent (-1 for the root) and returns its index.
+        Nodes must be added in pre order."""
+        return self.add_symbol_node(parent, self.symbols.intern(data), duration, self.symbols.intern(path) if path is not None else -1)
+
+    def add_symbol_node(self, parent, name_id, duration, path_id=-1):
+        """Same as add_node, with data and path already interned in the tree's symbol table ( -1 for no path )."""
+        index = len(self.name_id)
+        assert parent < index
+        assert parent >= 0 or index == 0, "Only the root has no parent"
+
+        self.name_id.append(name_id)
+        self.path_id.append(path_id)
+        self.parent.append(parent)
+        self.depth.append(self.depth[parent] + 1 if parent >= 0 else 0)
+        self.duration.append(duration)
+        self.self_child_count.append(0)
+        self.self_duration.append(-1.0)
+        self.child_count.append(-1)
+        self.self_leaf_child_count.append(-1)
+
+        if parent >= 0:
+            self.self_child_count[parent] += 1
+        return index
+
+    def get_data(self, index):
+        return self.symbols.names[self.name_id[index]]
+
+    def get_path(self, index):
+        """Returns the path of a node, or its data if it has none."""
+        path_id = self.path_id[index]
+        names = self.symbols.names
+        return names[path_id] if path_id >= 0 else names[self.name_id[index]]
+
+    def get_children(self, index):
+        """Returns the indices of the direct children of a node. Needs cache_useful_data."""
+        children = []
+        child = index + 1
+        end = index + 1 + self.child_count[index]
+        while child < end:
+            children.append(child)
+            child += self.child_count[child] + 1
+        return children
+
+    def cache_useful_data(self):
+        """Computes self durations and child counts of every node."""
+        aggregates = aggregate_tree(self.parent, self.duration)
+        self.self_duration = aggregates.self_duration
+        self.child_count = aggregates.child_count
+        self.self_leaf_child_count = aggregates.self_leaf_child_count
+
+    def to_nodes(self):
+        """Returns ( data, duration, self_duration, child_count, self_leaf_child_count, depth, path ) for every node
+        using pre order, path being None for nodes without one."""
+        names = self.symbols.names
+        paths = [names[path_id] if path_id >= 0 else None for path_id in self.path_id]
+        return list(zip(map(self.get_data, range(len(self))), self.duration, self.self_duration,
+                        self.child_count, self.self_leaf_child_count, self.depth, paths))
+
+    def get_nodes_po(self):
+        """Returns pairs ( node, depth ) using pre order."""
+        depths = self.depth
+        for index in range(len(self)):
+            yield CompactTreeNode(self, index), depths[index]
+
+    def print(self):
+        for node, indent in self.get_nodes_po():
+            print("{}{}".format("\t" * indent, node.to_string()))
+
+
+class CompactTreeNode:
+    """Lightweight view of a single CompactTree node, exposing the same attributes as the object based nodes."""
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, CompactTreeNode) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    @property
+    def data(self):
+        return self.tree.get_data(self.index)
+
+    name = data
+
+    @property
+    def path(self):
+        path_id = self.tree.path_id[self.index]
+        return self.tree.names[path_id] if path_id >= 0 else None
+
+    @property
+    def duration(self):
+        return self.tree.duration[self.index]
+
+    @duration.setter
+    def duration(self, duration):
+        self.tree.duration[self.index] = duration
+
+    time = duration
+
+    @property
+    def self_duration(self):
+        return self.tree.self_duration[self.index]
+
+    @property
+    def child_count(self):
+        return self.tree.child_count[self.index]
+
+    @property
+    def self_child_count(self):
+        return self.tree.self_child_count[self.index]
+
+    @property
+    def self_leaf_child_count(self):
+        return self.tree.self_leaf_child_count[self.index]
+
+    @property
+    def parent(self):
+        parent = self.tree.parent[self.index]
+        return CompactTreeNode(self.tree, parent) if parent >= 0 else None
+
+    @property
+    def children(self):
+        return [CompactTreeNode(self.tree, child) for child in self.tree.get_children(self.index)]
+
+    @property
+    def tree_path(self):
+        """Tree made out of 'data' separated by \\, computed on demand instead of being stored."""
+        names = []
+        index = self.index
+        while index >= 0:
+            names.append(self.tree.get_data(index))
+            index = self.tree.parent[index]
+        return "\\".join(reversed(names))
+
+    def is_root(self):
+        return self.index == 0
+
+    def is_leaf(self):
+        return self.self_child_count <= 0
+
+    def to_string(self):
+        if self.index > 0:
+            return "{} : {}s".format(self.data, self.duration)
+        else:
+            return "root"
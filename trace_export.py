@@ -0,0 +1,141 @@
+"""Exports translation units as trace events, to browse them on a timeline in chrome://tracing or https://ui.perfetto.dev.
+
+Every translation unit is a thread of its own, showing its includes, then its classes, then its functions.
+Events are written as files are parsed, and big builds are split over several files:
+
+    python trace_export.py Log.txt Build.trace.json --split-mb 128
+"""
+import argparse
+import json
+import os
+from array import array
+
+from results_db import get_tree_columns
+
+# A new file is started once the current one holds this many bytes, so that every file still loads in a trace viewer.
+TRACE_FILE_BYTES = 256 * 1024 * 1024
+
+TRACE_CATEGORIES = (("includes", "Include Headers"), ("classes", "Class Definitions"), ("functions", "Function Definitions"))
+
+TRACE_EVENT = '{"name":%s,"cat":"%s","ph":"X","ts":%.3f,"dur":%.3f,"pid":1,"tid":%d}'
+TRACE_THREAD_NAME = '{"name":"thread_name","ph":"M","pid":1,"tid":%d,"args":{"name":%s}}'
+TRACE_PROCESS_NAME = '{"name":"process_name","ph":"M","pid":1,"args":{"name":"Build"}}'
+
+
+def get_trace_file_path(path, index):
+    """Returns path for the first file and path with _index before its extension for the following ones."""
+    if index == 0:
+        return path
+    root, extension = os.path.splitext(path)
+    return "{}_{}{}".format(root, index, extension)
+
+
+def layout_tree(parents, durations, start=0.0):
+    """Returns the start time of every node of a tree in pre order, placing children one after the other
+    from the start of their parent."""
+    starts = array("d", bytes(8 * len(parents)))
+    # Start of the next child of every node.
+    next_starts = array("d", bytes(8 * len(parents)))
+    for index, parent in enumerate(parents):
+        node_start = next_starts[parent] if parent >= 0 else start
+        starts[index] = node_start
+        next_starts[index] = node_start
+        if parent >= 0:
+            next_starts[parent] = node_start + durations[index]
+    return starts
+
+
+class TraceWriter:
+    """Writes translation units as trace events ( chrome://tracing, Perfetto ), one thread per translation unit.
+
+    The includes, classes and functions of a translation unit are shown one after the other, every node
+    starting after its previous sibling. Events are written as translation units are added, and a new file
+    is started between two translation units once the current one grows past max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=TRACE_FILE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.paths = []
+        self.file = None
+        self.file_bytes = 0
+        self.thread_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open_file(self):
+        self.close_file()
+        path = get_trace_file_path(self.path, len(self.paths))
+        self.paths.append(path)
+        self.file = open(path, "w", encoding="utf-8", buffering=1024 * 1024)
+        self.file_bytes = 0
+        self.write('{"displayTimeUnit":"ms","traceEvents":[\n' + TRACE_PROCESS_NAME)
+
+    def close_file(self):
+        if self.file is not None:
+            self.write("\n]}\n")
+            self.file.close()
+            self.file = None
+
+    def write(self, text):
+        self.file.write(text)
+        # Characters rather than bytes, close enough to bound the file size.
+        self.file_bytes += len(text)
+
+    def add_translation_unit(self, name, headers, classes, functions):
+        """Adds the trees of a translation unit, any of which can be None, as a thread of its own."""
+        if self.file is None or self.file_bytes >= self.max_bytes:
+            self.open_file()
+
+        self.thread_count += 1
+        tid = self.thread_count
+        events = [TRACE_THREAD_NAME % (tid, json.dumps(name, ensure_ascii=False))]
+        start = 0.0
+        for (category, title), tree in zip(TRACE_CATEGORIES, (headers, classes, functions)):
+            if tree is None:
+                continue
+
+            names, paths, parents, depths, durations = get_tree_columns(tree)
+            starts = layout_tree(parents, durations, start)
+            events.append(TRACE_EVENT % (json.dumps(title), category, starts[0] * 1e6, durations[0] * 1e6, tid))
+            events += [TRACE_EVENT % (json.dumps(names[index], ensure_ascii=False), category, starts[index] * 1e6, durations[index] * 1e6, tid)
+                       for index in range(1, len(names))]
+            start += durations[0]
+
+        self.write(",\n" + ",\n".join(events))
+
+    def add_record(self, record):
+        """Adds a LogRecord or a TimingFile."""
+        self.add_translation_unit(record.name, record.headers, record.classes, record.functions)
+
+    def close(self):
+        """Finishes the current file. paths lists every file written."""
+        self.close_file()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Exports the timings of a build as trace events.")
+    parser.add_argument("path", help="log, .cpp.timing.txt file or folder of them, - reads a log from stdin")
+    parser.add_argument("output", help="trace file to write, following files get _1, _2... before their extension")
+    parser.add_argument("--split-mb", type=float, default=TRACE_FILE_BYTES / (1024 * 1024), metavar="MB",
+                        help="start a new file once the current one is this big (default: 256)")
+    return parser.parse_args()
+
+
+def main():
+    import compile_times
+
+    arguments = parse_arguments()
+    with TraceWriter(arguments.output, int(arguments.split_mb * 1024 * 1024)) as writer:
+        for record in compile_times.iter_records(arguments.path, compact=True):
+            writer.add_record(record)
+
+    print("{} files exported to {}".format(writer.thread_count, ", ".join(writer.paths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Follows a build in progress and keeps a report of its slowest files, headers and functions up to date.
+
+Either tails a growing log ( Unreal, MSVC or Qt, like main.py ) or polls a folder for new or changed
+.cpp.timing.txt files ( like main_ue423.py ). Only new content is parsed:
+
+    python watch.py Engine/Programs/UnrealBuildTool/Log.txt
+    python watch.py MyProject/Intermediate --interval 5
+"""
+import argparse
+import heapq
+import os
+import sys
+import time
+
+from hotspots import HotspotReport, TopK, print_hotspots
+from main import LineReader, LogParser, detect_configuration
+from main_ue423 import get_timing_file_paths, read_timing_file
+from results_db import get_tree_columns
+
+
+def follow_lines(path, interval=1.0, idle_timeout=None):
+    """Yields the lines of a file that is still being written, waiting for lines to be appended.
+
+    Only whole lines are yielded. Ends once nothing was appended for idle_timeout seconds, if given,
+    leaving out an unfinished last line: the end of the iteration is the end of the input.
+    """
+    with open(path, "r", encoding="utf-8-sig") as file:
+        partial = ""
+        last_data = time.monotonic()
+        while True:
+            line = file.readline()
+            if line:
+                last_data = time.monotonic()
+                if line.endswith("\n"):
+                    yield partial + line
+                    partial = ""
+                else:
+                    partial += line
+            elif idle_timeout is not None and time.monotonic() - last_data >= idle_timeout:
+                return
+            else:
+                time.sleep(interval)
+
+
+def iter_followed_log_records(path, interval=1.0, idle_timeout=None):
+    """Yields a LogRecord for every file compiled in a log that is still being written, as soon as its action is complete.
+    An action the log stops in the middle of, once idle_timeout expired, is left out."""
+    reader = LineReader(follow_lines(path, interval, idle_timeout))
+    parser = LogParser(reader, detect_configuration(reader.peek()), verbose=False, compact=True, partial_input=True)
+    yield from parser.iter_records()
+
+
+def iter_polled_timing_files(path, interval=1.0, idle_timeout=None):
+    """Yields a TimingFile for every .cpp.timing.txt file that appears or changes under path, polling every interval seconds.
+
+    A file is read once its size and modification time stayed the same over two polls, so that files still
+    being written are left for later. Ends once nothing changed for idle_timeout seconds, if given.
+    """
+    read_files = {}
+    changed_files = {}
+    last_change = time.monotonic()
+    while True:
+        for file_path in get_timing_file_paths(path):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if read_files.get(file_path) == signature:
+                continue
+
+            last_change = time.monotonic()
+            if changed_files.get(file_path) != signature:
+                changed_files[file_path] = signature
+                continue
+
+            del changed_files[file_path]
+            read_files[file_path] = signature
+            timing_file = read_timing_file(file_path, compact=True)
+            if timing_file:
+                yield timing_file
+
+        if idle_timeout is not None and time.monotonic() - last_change >= idle_timeout:
+            return
+        time.sleep(interval)
+
+
+class WatchState:
+    """Running aggregates of every record seen so far.
+
+    Totals add up everything that was compiled: a file compiled twice counts twice, as it cost time twice.
+    """
+
+    def __init__(self, count=10):
+        self.count = count
+        self.file_count = 0
+        self.node_count = 0
+        self.totals = {"includes": 0.0, "classes": 0.0, "functions": 0.0}
+        # Header name -> [ inclusion count, cumulative inclusive time ].
+        self.headers = {}
+        self.files = TopK(count)
+        self.hotspots = HotspotReport({"includes": count, "functions": count})
+
+    def add_record(self, record):
+        """Adds a LogRecord or a TimingFile."""
+        self.file_count += 1
+        file_time = 0.0
+        for category, tree in zip(self.totals, (record.headers, record.classes, record.functions)):
+            if tree is None:
+                continue
+
+            names, paths, parents, depths, durations = get_tree_columns(tree)
+            self.node_count += len(names)
+            self.totals[category] += durations[0]
+            file_time += durations[0]
+
+            if category == "includes":
+                headers = self.headers
+                for index in range(1, len(names)):
+                    header = headers.get(names[index])
+                    if header is None:
+                        header = headers[names[index]] = [0, 0.0]
+                    header[0] += 1
+                    header[1] += durations[index]
+
+        self.files.push(file_time, record.name)
+        self.hotspots.add_record(record)
+
+    def print(self):
+        print("{} files, {} nodes parsed. Includes: {:.1f}s, classes: {:.1f}s, functions: {:.1f}s".format(
+            self.file_count, self.node_count, self.totals["includes"], self.totals["classes"], self.totals["functions"]))
+
+        print("Slowest files:")
+        for file_time, name in self.files.get_items():
+            print("  {:10.3f}s  {}".format(file_time, name))
+
+        print("Most expensive headers:")
+        for name, (include_count, include_time) in heapq.nlargest(self.count, self.headers.items(), key=lambda item: item[1][1]):
+            print("  {:10.3f}s  {} ( included {} times )".format(include_time, name, include_count))
+
+        print("Slowest single includes and functions:")
+        print_hotspots(self.hotspots.get_results(), "  ")
+
+
+def watch(records, state, refresh=5.0):
+    """Adds records to state as they come and prints it at most every refresh seconds, and once more at the end.
+    Stops early on Ctrl+C."""
+    last_print = time.monotonic()
+    try:
+        for record in records:
+            state.add_record(record)
+            if time.monotonic() - last_print >= refresh:
+                if sys.stdout.isatty():
+                    print("\033[2J\033[H", end="")
+                state.print()
+                print()
+                last_print = time.monotonic()
+    except KeyboardInterrupt:
+        print("Stopped")
+
+    state.print()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Reports the slowest files, headers and functions of a build while it is running.")
+    parser.add_argument("path", help="log file to follow, or folder polled for .cpp.timing.txt files")
+    parser.add_argument("--interval", type=float, default=1.0, metavar="SECONDS",
+                        help="time between checks for new data (default: 1)")
+    parser.add_argument("--refresh", type=float, default=5.0, metavar="SECONDS",
+                        help="minimum time between two reports (default: 5)")
+    parser.add_argument("--idle-timeout", type=float, metavar="SECONDS",
+                        help="stop once nothing new was written for this long, by default runs until Ctrl+C")
+    parser.add_argument("-n", "--count", type=int, default=10, help="entries listed per report section (default: 10)")
+    return parser.parse_args()
+
+
+def main():
+    arguments = parse_arguments()
+    if os.path.isdir(arguments.path):
+        records = iter_polled_timing_files(arguments.path, arguments.interval, arguments.idle_timeout)
+    else:
+        records = iter_followed_log_records(arguments.path, arguments.interval, arguments.idle_timeout)
+
+    watch(records, WatchState(arguments.count), arguments.refresh)
+
+
+if __name__ == "__main__":
+    main()
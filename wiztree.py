@@ -0,0 +1,53 @@
+import gzip
+
+# Rows are gathered in memory and handed to the file in blocks of this many rows.
+WIZTREE_BLOCK_ROWS = 16384
+
+# File name, size, allocated, files and folders of a single WizTree .csv row.
+WIZTREE_ROW = '"%s",%d,%d,2019/01/01 00:00:00,0,%d,%d\n'
+
+
+def open_wiztree_file(path, compress=False, encoding=None):
+    """Opens a .csv file for writing, or a .csv.gz file if compress is set. Returns the file and its actual path."""
+    if compress:
+        path += ".gz"
+        return gzip.open(path, "wt", encoding=encoding, compresslevel=6), path
+    else:
+        return open(path, "w", encoding=encoding, buffering=1024 * 1024), path
+
+
+class WizTreeWriter:
+    """Writes several WizTree .csv files side by side, so that every tree only has to be traversed once.
+
+    paths maps a category name to the path of its .csv file. Rows are formatted by the caller
+    and written in large blocks.
+    """
+
+    def __init__(self, paths, header, compress=False, encoding=None):
+        self.files = {}
+        self.paths = {}
+        self.blocks = {}
+        for name, path in paths.items():
+            self.files[name], self.paths[name] = open_wiztree_file(path, compress, encoding)
+            self.files[name].write(header)
+            self.blocks[name] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_rows(self, name, rows):
+        """Appends rows ( strings ending with a new line ) to the file of a category."""
+        block = self.blocks[name]
+        block.extend(rows)
+        if len(block) >= WIZTREE_BLOCK_ROWS:
+            self.files[name].write("".join(block))
+            block.clear()
+
+    def close(self):
+        for name, file in self.files.items():
+            file.write("".join(self.blocks[name]))
+            file.close()
+        self.files = {}